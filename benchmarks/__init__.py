@@ -0,0 +1,6 @@
+"""Benchmarks for the parsing and generation hot paths.
+
+Run them from the repository root with:
+
+    python -m benchmarks [--filter NAME] [--save baseline.json] [--compare baseline.json]
+"""
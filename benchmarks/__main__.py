@@ -0,0 +1,47 @@
+import argparse
+import sys
+from .workloads import workloads
+from nangram.util import format_time
+from .runner import run, compare, load_baseline, save_baseline
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark the parse and generate hot paths.')
+    parser.add_argument('--filter', default='', help='only run workloads whose name contains this')
+    parser.add_argument('--save', metavar='PATH', help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare the results against a JSON baseline')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds to time every workload for at least (default 0.5)')
+    parser.add_argument('--threshold', type=float, default=0.25, help='median slowdown fraction that counts as a regression (default 0.25)')
+    arguments = parser.parse_args()
+
+    baseline = load_baseline(arguments.compare) if arguments.compare else {}
+
+    print(f'{"workload":<28} {"ops/s":>10} {"p50":>10} {"p90":>10} {"p99":>10} {"peak mem":>10} {"vs base":>8}')
+    results = []
+    failures = []
+    for workload in workloads():
+        if arguments.filter not in workload.name:
+            continue
+        try:
+            result = run(workload, arguments.min_time)
+        except Exception as error:
+            failures.append(workload.name)
+            print(f'{workload.name:<28} failed: {error!r}', flush=True)
+            continue
+        results.append(result)
+        previous = baseline.get(result['name'])
+        change = f'{result["p50"] / previous["p50"] - 1:+.0%}' if previous else ''
+        print(f'{result["name"]:<28} {result["throughput"]:>10.1f} {format_time(result["p50"]):>10} {format_time(result["p90"]):>10} '
+              f'{format_time(result["p99"]):>10} {result["peak_bytes"] / 1024:>8.0f}KB {change:>8}', flush=True)
+
+    if arguments.save:
+        save_baseline(arguments.save, results)
+
+    regressions = compare(results, baseline, arguments.threshold)
+    if regressions:
+        print(f'\nRegressed by more than {arguments.threshold:.0%}: {", ".join(regressions)}')
+    if failures:
+        print(f'\nFailed: {", ".join(failures)}')
+    return 1 if regressions or failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Timing, memory measurement and baseline comparison of benchmark workloads."""
+
+from __future__ import annotations
+import gc
+import json
+import time
+import tracemalloc
+from nangram.util import percentile
+
+def run(workload, min_time: float = 0.5, warmup_time: float = 0.1) -> dict:
+    """Time a workload and measure its peak memory, returning a result row.
+
+    After warming up for warmup_time seconds, the workload runs at least its number of repeats and for at least min_time seconds,
+    with garbage collection off so that collections started by earlier runs don't land in later ones.
+    """
+
+    operation = workload.setup()
+
+    # one untimed run, which also fills any caches, traced for the peak memory
+    tracemalloc.start()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # untraced warm up runs, as tracing slows everything down
+    end = time.perf_counter() + warmup_time
+    while time.perf_counter() < end:
+        operation()
+
+    latencies = []
+    gc.collect()
+    gc.disable()
+    try:
+        end = time.perf_counter() + min_time
+        while len(latencies) < workload.repeat or time.perf_counter() < end:
+            start = time.perf_counter()
+            operation()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    latencies.sort()
+
+    return {
+        'name':       workload.name,
+        'runs':       len(latencies),
+        'throughput': len(latencies) / sum(latencies),
+        'min':        latencies[0],
+        'p50':        percentile(latencies, 0.5),
+        'p90':        percentile(latencies, 0.9),
+        'p99':        percentile(latencies, 0.99),
+        'peak_bytes': peak,
+    }
+
+def compare(results: list, baseline: dict, threshold: float) -> list:
+    """Return the names of the workloads whose median latency regressed by more than a threshold fraction against a baseline.
+
+    A workload only counts as regressed if even its fastest run is slower than the baseline's median, so a few slow runs don't make one.
+    """
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous and result['p50'] > previous['p50'] * (1 + threshold) and result['min'] > previous['p50']:
+            regressions.append(result['name'])
+    return regressions
+
+def load_baseline(path: str) -> dict:
+    with open(path) as f:
+        return {result['name']: result for result in json.load(f)}
+
+def save_baseline(path: str, results: list):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,134 @@
+"""Benchmark workloads: the english example plus synthetic grammars scaled along one dimension at a time."""
+
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from itertools import islice
+import os
+import random
+from nangram import Grammar, ResultCache
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples')
+
+@dataclass
+class Workload:
+    """A named operation to time, built by a setup function so that setup costs aren't measured."""
+
+    name: str
+    setup: object
+    repeat: int = 20
+
+def english_grammar() -> Grammar:
+    return Grammar.load_bnf(os.path.join(EXAMPLES, 'english.bnf'))
+
+def english_sentences(n: int) -> list:
+    random.seed(0)
+    return list(english_grammar().sample(n))
+
+def chain_grammar(rules: int) -> Grammar:
+    """Rules that each substitute the next one, n levels deep."""
+
+    source = '\n'.join(f'r{i} = r{i + 1} | "x{i}" .' for i in range(rules))
+    return Grammar.parse_bnf(f'main = r0 .\n{source}\nr{rules} = "end" .')
+
+def choice_grammar(alternatives: int) -> Grammar:
+    """A single choice among many multi-character words."""
+
+    words = ' | '.join(f'"w{i}"' for i in range(alternatives))
+    return Grammar.parse_bnf(f'main = word {{ " " word }} .\nword = {words} .')
+
+def ambiguous_grammar() -> Grammar:
+    """Every split of a run of a's into ones and twos is a parse tree."""
+
+    return Grammar.parse_bnf('main = { x } . x = "a" | "a" "a" | y . y = "a" .')
+
+def nested_grammar(depth: int) -> Grammar:
+    """Options nested n levels deep."""
+
+    return Grammar.parse_bnf('main = ' + '[ "(" ' * depth + '"x"' + ' ")" ]' * depth + ' .')
+
+def list_grammar() -> Grammar:
+    return Grammar.parse_bnf('main = item { "," item } . item = "ab" | "a" | "b" .')
+
+def token_grammar() -> Grammar:
+    """Identifiers and numbers separated by runs of white space, matched by character classes."""
+
+    return Grammar.parse_bnf(r'main = token { <\s> { <\s> } token } . token = <a-zA-Z_> { <\w> } | <0-9> { <\d> } .')
+
+def token_source(tokens: int) -> str:
+    random.seed(0)
+    return '  '.join(random.choice(['name_', 'x', 'long_identifier_1', '42', '1000000']) for _ in range(tokens))
+
+def statement_grammar() -> Grammar:
+    """Nested if statements whose alternatives share a long prefix, written one terminal at a time."""
+
+    return Grammar.parse_bnf('''
+        main = statement .
+        statement = "if" " " condition " " "then" " " statement " " "else" " " statement
+                  | "if" " " condition " " "then" " " statement
+                  | "print" " " value .
+        condition = value " " "=" "=" " " value | value .
+        value = name | number .
+        name = "x" | "y" | "z" .
+        number = <0-9> { <0-9> } .
+    ''')
+
+def statement_source(depth: int) -> str:
+    return 'if x == 1 then ' * depth + 'print y' + ' else print 2' * (depth // 2)
+
+def bnf_source(rules: int) -> str:
+    """A BNF source with n rules of several labeled items each."""
+
+    return '\n'.join(f'rule{i} "override" = a:rule{i + 1} [ "x" ] {{ "y" | "z" }} | "w{i}" .' for i in range(rules))
+
+def parse_all(grammar: Grammar, strings: list, **options):
+    def run():
+        for string in strings:
+            next(grammar.parse_complete(string, **options), None)
+    return run
+
+def workloads() -> list:
+    """Return every benchmark workload."""
+
+    result = [
+        Workload('english/parse', lambda: parse_all(english_grammar(), english_sentences(50))),
+        Workload('english/parse-cached', lambda: (lambda grammar: parse_all(grammar, english_sentences(50)))(replace(english_grammar(), results=ResultCache()))),
+        Workload('english/parse-earley', lambda: parse_all(english_grammar(), english_sentences(50), engine='earley')),
+        Workload('english/generate', lambda: (lambda grammar: lambda: list(grammar.generate()))(english_grammar())),
+        Workload('english/stream-10k', lambda: (lambda grammar: lambda: list(islice(grammar.stream(), 10000)))(english_grammar()), repeat=5),
+        Workload('english/sample-1k', lambda: (lambda grammar: lambda: list(grammar.sample(1000)))(english_grammar())),
+        Workload('english/random-1k', lambda: (lambda grammar: lambda: [grammar.random_expression() for _ in range(1000)])(english_grammar())),
+        Workload('english/load-bnf', lambda: english_grammar),
+    ]
+
+    for rules in (10, 50, 100):
+        result.append(Workload(f'rules/{rules}', lambda rules=rules: parse_all(chain_grammar(rules), ['end', f'x{rules - 1}'])))
+    for rules in (100, 1000):
+        result.append(Workload(f'random-deep/{rules}', lambda rules=rules: (lambda grammar: lambda: [grammar.random_expression(max_depth=rules + 1) for _ in range(100)])(chain_grammar(rules))))
+    # picking a word shouldn't take longer with a larger lexicon
+    for alternatives in (100, 10000):
+        result.append(Workload(f'random-lexicon/{alternatives}', lambda alternatives=alternatives: (lambda grammar: lambda: [grammar.random_expression() for _ in range(1000)])(choice_grammar(alternatives))))
+    for alternatives in (10, 100, 1000):
+        result.append(Workload(f'alternatives/{alternatives}', lambda alternatives=alternatives: parse_all(choice_grammar(alternatives), [' '.join(f'w{i % alternatives}' for i in range(0, 100, 7))])))
+    for length in (8, 16):
+        result.append(Workload(f'ambiguity/{length}', lambda length=length: (lambda forest_grammar: lambda: forest_grammar.parse_forest('a' * length).count())(ambiguous_grammar())))
+    for depth in (5, 20, 50):
+        result.append(Workload(f'nesting/{depth}', lambda depth=depth: parse_all(nested_grammar(depth), ['(' * depth + 'x' + ')' * depth])))
+    for length in (100, 300):
+        string = ','.join(['ab'] * length)
+        result.append(Workload(f'long-input/{length}', lambda string=string: parse_all(list_grammar(), [string]), repeat=5))
+        result.append(Workload(f'long-input-earley/{length}', lambda string=string: parse_all(list_grammar(), [string], engine='earley'), repeat=5))
+    string = ','.join(['ab'] * 10000)
+    result.append(Workload('long-input/10000', lambda: parse_all(list_grammar(), [string]), repeat=3))
+    # complete trees only, which should scale with the input like the forest does
+    for length in (1000, 4000):
+        string = ','.join(['ab'] * length)
+        result.append(Workload(f'long-input-earley/{length}', lambda string=string: parse_all(list_grammar(), [string], engine='earley'), repeat=3))
+    for tokens in (25, 50):
+        result.append(Workload(f'tokens/{tokens}', lambda tokens=tokens: parse_all(token_grammar(), [token_source(tokens)]), repeat=5))
+    result.append(Workload('statements/8', lambda: parse_all(statement_grammar(), [statement_source(8)])))
+    result.append(Workload('statements-optimized/8', lambda: parse_all(statement_grammar().optimize(), [statement_source(8)])))
+    for rules in (10, 100, 1000):
+        result.append(Workload(f'parse-bnf/{rules}', lambda rules=rules: (lambda source: lambda: Grammar.parse_bnf(source))(bnf_source(rules))))
+    for rules in (10, 200):
+        result.append(Workload(f'parse-bnf-meta/{rules}', lambda rules=rules: (lambda source: lambda: Grammar.parse_bnf(source, fast=False))(bnf_source(rules)), repeat=3))
+    return result
@@ -1,4 +1,4 @@
-from nangram import Grammar, random_sample, random_choice
+from nangram import Grammar
 
 if __name__ == '__main__':
 
@@ -12,12 +12,12 @@ if __name__ == '__main__':
     sample_size = 5
 
     print('Generating a single sentence...\n')
-    expression = random_choice(lambda: grammar.generate(rule, verbose=verbose))
+    expression = grammar.random_expression(rule)
     print(expression)
     print()
 
     print(f'Generating {sample_size} sentences...\n')
-    for expression in random_sample(lambda: grammar.generate(rule, verbose=verbose), sample_size):
+    for expression in grammar.sample(sample_size, rule):
         print(expression)
         for tree in grammar.parse_complete(expression, rule, verbose=verbose):
             print(tree)
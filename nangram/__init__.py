@@ -1,4 +1,10 @@
 from .util import *
 from .node import Node
+from .memo import Memo
+from .incremental import IncrementalMemo, IncrementalParse
 from .element import *
+from .forest import Forest, SymbolNode, PrefixNode
 from .grammar import Grammar
+from .trace import Tracer, PrintTracer, RuleStats
+from .aio import Limits
+from .results import ResultCache
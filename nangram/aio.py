@@ -0,0 +1,125 @@
+"""Asynchronous parsing and generation for asyncio programs, with step budgets, deadlines and cancellation."""
+
+from __future__ import annotations
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from time import monotonic
+from .node import Node
+
+# marks an exhausted iterator
+END = object()
+
+class Limits:
+    """Tracer stopping a call that takes too many steps, runs past its deadline or gets cancelled.
+
+    A step is every time a rule is used, or resumed for another result, by the recursive descent parser or by generation.
+    Stopping raises a TimeoutError, or a CancelledError once cancelled is set, from inside the call.
+    A tracer the grammar already had keeps recording underneath.
+    """
+
+    def __init__(self, max_steps: int = None, timeout: float = None, tracer: Tracer = None):
+        self.max_steps = max_steps
+        self.deadline = None if timeout is None else monotonic() + timeout
+        self.tracer = tracer
+        self.steps = 0
+
+        # set from another thread to stop a call running there
+        self.cancelled = False
+
+    def step(self):
+        """Count a step, raising if the call has to stop."""
+
+        self.steps += 1
+        if self.cancelled:
+            raise asyncio.CancelledError()
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise TimeoutError(f'Gave up after {self.max_steps} steps.')
+        if self.deadline is not None and monotonic() > self.deadline:
+            raise TimeoutError(f'Gave up at the deadline after {self.steps} steps.')
+
+    def release(self):
+        """Stop enforcing the limits once the call is over, since its parse trees keep the grammar they were parsed with."""
+
+        self.max_steps = self.deadline = None
+
+    def trace(self, rule: str, call, position: int = None):
+        """Generate the results of a rule, taking a step before each of them."""
+
+        iterator = None
+        while True:
+            self.step()
+            if iterator is None:
+                iterator = iter(call() if self.tracer is None else self.tracer.trace(rule, call, position))
+            result = next(iterator, END)
+            if result is END:
+                return
+            yield result
+
+def run_limited(grammar: Grammar, method: str, args: tuple, keep=None, max_steps: int = None, timeout: float = None) -> list:
+    """Run a whole call within limits and return its kept results, in a worker process."""
+
+    return list(filter(keep, getattr(grammar.traced(Limits(max_steps, timeout, grammar.tracer)), method)(*args)))
+
+def take(iterator, limits: Limits, yield_every: int) -> list:
+    """Return the next results of a call until yield_every steps went by, ending with END once there are no more, in a thread."""
+
+    results = []
+    start = limits.steps
+    while True:
+        result = next(iterator, END)
+        results.append(result)
+        if result is END or limits.steps - start >= yield_every:
+            return results
+
+async def iterate(grammar: Grammar, method: str, args: tuple, keep=None, yield_every: int = 1000,
+                  max_steps: int = None, timeout: float = None, executor='thread'):
+    """Generate the results of a call of a grammar method asynchronously, see Grammar.parse_async.
+
+    keep filters the results, and has to be picklable for process pools; every result counts towards yield_every, kept or not.
+    """
+
+    if isinstance(executor, ProcessPoolExecutor):
+        # the whole call runs in the worker, which enforces its own limits
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(executor, run_limited, grammar, method, args, keep, max_steps, timeout)
+        for result in results:
+            if isinstance(result, Node):
+                # trees are pickled without their grammar
+                result.attach(grammar)
+            yield result
+        return
+
+    limits = Limits(max_steps, timeout, grammar.tracer)
+    call = lambda: iter(getattr(grammar.traced(limits), method)(*args))
+    try:
+        if executor is None:
+            # the call runs in the event loop, which only gets control back between results, once enough steps went by
+            last = 0
+            for result in call():
+                if keep is None or keep(result):
+                    yield result
+                if limits.steps - last >= yield_every:
+                    last = limits.steps
+                    await asyncio.sleep(0)
+        else:
+            # the call runs in a thread, yield_every steps worth of results at a time, including any work done up front like building a parse forest
+            loop = asyncio.get_running_loop()
+            executor = None if executor == 'thread' else executor
+            iterator = None
+            while True:
+                try:
+                    if iterator is None:
+                        iterator = await loop.run_in_executor(executor, call)
+                    results = await loop.run_in_executor(executor, take, iterator, limits, yield_every)
+                except asyncio.CancelledError:
+                    # the thread keeps going until its next step
+                    limits.cancelled = True
+                    raise
+                for result in results:
+                    if result is END:
+                        return
+                    if keep is None or keep(result):
+                        yield result
+    finally:
+        if not limits.cancelled:
+            limits.release()
@@ -0,0 +1,195 @@
+"""Static analysis of grammars: nullable, FIRST and FOLLOW sets of every rule and element, and compiled terminal tries."""
+
+from __future__ import annotations
+from collections import deque
+from .element import *
+from .trie import TerminalTrie
+
+# stands for any character in the FIRST set of elements that can't be analyzed, like StringLiteralCharacter
+ANY = object()
+
+def sub_elements(element: Element) -> list:
+    """Return the direct sub-elements of an element."""
+
+    if isinstance(element, (Sequence, Choice)):
+        return element.elements
+    elif isinstance(element, (Option, Repetition)):
+        return [element.element]
+    return []
+
+class Analysis:
+    """Nullable, FIRST and FOLLOW sets of every rule and element in a grammar, and lookahead indices built from them.
+
+    Elements are keyed by id, so the analysis is only valid as long as the grammar's rules aren't changed.
+    """
+
+    def __init__(self, grammar: Grammar, precomputed: tuple = None):
+        """Analyze a grammar, or take the nullable, FIRST and FOLLOW sets from a compiled grammar as lists in the order of the elements and rules, see compile_grammar."""
+
+        self.grammar = grammar
+
+        # every element reachable from the rules, children before their parents
+        self.elements = []
+        seen = set()
+        def visit(element):
+            if id(element) not in seen:
+                seen.add(id(element))
+                for child in sub_elements(element):
+                    visit(child)
+                self.elements.append(element)
+        for element in grammar.rules.values():
+            visit(element)
+
+        if precomputed is None:
+            self.nullable = {id(element): False for element in self.elements}
+            self.first = {id(element): frozenset() for element in self.elements}
+            self.compute_first()
+
+            self.follow = {name: frozenset() for name in grammar.rules}
+            self.compute_follow()
+        else:
+            nullable, first, follow = precomputed
+            self.nullable = {id(element): value for element, value in zip(self.elements, nullable)}
+            self.first = {id(element): value for element, value in zip(self.elements, first)}
+            self.follow = dict(zip(grammar.rules, follow))
+
+        # choice id -> (alternatives by next character, alternatives for any other character or the end of the string)
+        self.choice_index = {}
+        # choice id -> trie, for choices made only of terminals
+        self.tries = {}
+        for element in self.elements:
+            if isinstance(element, Choice):
+                self.choice_index[id(element)] = self.index(element.elements)
+                if all(type(alternative) is Terminal for alternative in element.elements):
+                    self.tries[id(element)] = TerminalTrie(element.elements)
+
+    def rule_nullable(self, name: str) -> bool:
+        """Return whether a rule can match the empty string."""
+
+        return self.nullable[id(self.grammar.rules[name])]
+
+    def rule_first(self, name: str) -> frozenset:
+        """Return the characters a match of a rule can start with."""
+
+        return self.first[id(self.grammar.rules[name])]
+
+    def compute_first(self):
+        """Compute the nullable and FIRST sets of every element by iterating to a fixed point.
+
+        Only the elements depending on one that changed are looked at again, so long chains of rules don't take a pass over the whole grammar per rule.
+        """
+
+        nullable, first = self.nullable, self.first
+        dependents = self.dependents()
+        queue = deque(self.elements)
+        queued = set(dependents)
+        while queue:
+            element = queue.popleft()
+            queued.discard(id(element))
+            is_nullable, characters = self.element_first(element)
+            if is_nullable != nullable[id(element)] or characters != first[id(element)]:
+                nullable[id(element)] = is_nullable
+                first[id(element)] = characters
+                for dependent in dependents[id(element)]:
+                    if id(dependent) not in queued:
+                        queued.add(id(dependent))
+                        queue.append(dependent)
+
+    def dependents(self) -> dict:
+        """Return the elements whose sets are computed from each element by id, its parents and the substitutions of rules."""
+
+        rules = self.grammar.rules
+        dependents = {id(element): [] for element in self.elements}
+        for element in self.elements:
+            for child in sub_elements(element):
+                dependents[id(child)].append(element)
+            if isinstance(element, Substitution) and element.name in rules:
+                dependents[id(rules[element.name])].append(element)
+        return dependents
+
+    def element_first(self, element: Element) -> (bool, frozenset):
+        """Return the nullable and FIRST set of an element from the current ones of its sub-elements."""
+
+        nullable, first = self.nullable, self.first
+        if isinstance(element, Terminal):
+            return element.string == '', frozenset(element.string[:1])
+        elif isinstance(element, Substitution):
+            rule = self.grammar.rules.get(element.name)
+            if rule is None:
+                # leave undefined rules to fail at parse time
+                return True, frozenset([ANY])
+            return nullable[id(rule)], first[id(rule)]
+        elif isinstance(element, Sequence):
+            characters = frozenset()
+            for child in element.elements:
+                characters |= first[id(child)]
+                if not nullable[id(child)]:
+                    return False, characters
+            return True, characters
+        elif isinstance(element, Choice):
+            return any(nullable[id(child)] for child in element.elements), frozenset().union(*(first[id(child)] for child in element.elements))
+        elif isinstance(element, (Option, Repetition)):
+            return True, first[id(element.element)]
+        elif isinstance(element, CharClass):
+            return False, frozenset([ANY]) if element.negated else element.members
+        elif isinstance(element, StringLiteralCharacter):
+            return False, frozenset([ANY])
+        # nothing is known about other elements, so they are always tried
+        return True, frozenset([ANY])
+
+    def compute_follow(self):
+        """Compute the FOLLOW set of every rule by iterating to a fixed point.
+
+        The end of the string is not represented, since any rule may be used as the starting rule.
+        """
+
+        nullable, first, follow = self.nullable, self.first, self.follow
+        def visit(element, after: frozenset) -> bool:
+            changed = False
+            if isinstance(element, Substitution):
+                if element.name in follow and not after <= follow[element.name]:
+                    follow[element.name] |= after
+                    changed = True
+            elif isinstance(element, Sequence):
+                for child in reversed(element.elements):
+                    changed |= visit(child, after)
+                    after = first[id(child)] | after if nullable[id(child)] else first[id(child)]
+            elif isinstance(element, Choice):
+                for child in element.elements:
+                    changed |= visit(child, after)
+            elif isinstance(element, Option):
+                changed |= visit(element.element, after)
+            elif isinstance(element, Repetition):
+                changed |= visit(element.element, after | first[id(element.element)])
+            return changed
+
+        while any([visit(element, follow[name]) for name, element in self.grammar.rules.items()]):
+            pass
+
+    def index(self, alternatives: list) -> (dict, tuple):
+        """Index alternatives by the next character, keeping their order."""
+
+        always = [alternative for alternative in alternatives if self.nullable[id(alternative)] or ANY in self.first[id(alternative)]]
+        always_ids = set(map(id, always))
+        characters = set().union(*(self.first[id(alternative)] for alternative in alternatives)) - {ANY}
+        by_character = {character: tuple(alternative for alternative in alternatives
+                                         if id(alternative) in always_ids or character in self.first[id(alternative)])
+                        for character in characters}
+        return by_character, tuple(always)
+
+    def alternatives(self, choice: Choice, string: str, position: int):
+        """Return the alternatives of a choice that can match at a position of a string."""
+
+        index = self.choice_index.get(id(choice))
+        if index is None:
+            return choice.elements
+        by_character, always = index
+        return by_character.get(string[position:position + 1], always)
+
+    def can_start(self, element: Element, string: str, position: int) -> bool:
+        """Return whether an element can match at a position of a string."""
+
+        first = self.first.get(id(element))
+        if first is None or self.nullable[id(element)] or ANY in first:
+            return True
+        return string[position:position + 1] in first
@@ -0,0 +1,105 @@
+"""Batch parsing across a pool of worker processes."""
+
+from __future__ import annotations
+from collections import deque
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+from queue import SimpleQueue
+from time import perf_counter
+import os
+
+# the grammar and parse options of a pool worker process, set once by init_worker
+worker_state = None
+
+def init_worker(grammar: Grammar, rule_name: str, trees: bool, engine: str, timed: bool = False):
+    """Receive the grammar and parse options in a worker process."""
+
+    global worker_state
+    worker_state = (grammar, rule_name, trees, engine, timed)
+
+def parse_chunk(chunk: list) -> list:
+    """Parse a chunk of (index, string) pairs in a pool worker process and return (index, result) pairs."""
+
+    return parse_chunk_with(worker_state, chunk)
+
+def parse_chunk_with(state: tuple, chunk: list) -> list:
+    """Parse a chunk of (index, string) pairs with a given grammar and parse options and return (index, result) pairs."""
+
+    grammar, rule_name, trees, engine, timed = state
+    results = []
+    for index, string in chunk:
+        start = perf_counter()
+        if trees:
+            result = list(grammar.parse_complete(string, rule_name, engine=engine))
+        else:
+            result = grammar.accepts(string, rule_name, engine)
+        results.append((index, (result, perf_counter() - start) if timed else result))
+    return results
+
+def make_chunks(strings, chunksize: int):
+    """Split an iterable of strings lazily into lists of (index, string) pairs."""
+
+    iterator = enumerate(strings)
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def submit_chunks(pool: Pool, chunks, window: int, ordered: bool):
+    """Generate the results of parsing chunks in a pool with at most window chunks in flight, reading the next chunk only when a result is taken.
+
+    Results come in the order of the chunks if ordered is True, otherwise as soon as they are done.
+    """
+
+    if ordered:
+        pending = deque(pool.apply_async(parse_chunk, (chunk,)) for chunk in islice(chunks, window))
+        while pending:
+            result = pending.popleft().get()
+            for chunk in islice(chunks, 1):
+                pending.append(pool.apply_async(parse_chunk, (chunk,)))
+            yield result
+        return
+
+    done = SimpleQueue()
+    def submit(chunk):
+        pool.apply_async(parse_chunk, (chunk,), callback=done.put, error_callback=done.put)
+    in_flight = 0
+    for chunk in islice(chunks, window):
+        submit(chunk)
+        in_flight += 1
+    while in_flight:
+        result = done.get()
+        in_flight -= 1
+        if isinstance(result, BaseException):
+            raise result
+        for chunk in islice(chunks, 1):
+            submit(chunk)
+            in_flight += 1
+        yield result
+
+def parse_many(grammar: Grammar, strings, rule_name: str = 'main', workers: int = None, chunksize: int = 256, ordered: bool = True, trees: bool = True, engine: str = 'descent', timed: bool = False):
+    """Parse many strings across a pool of worker processes, see Grammar.parse_many."""
+
+    chunks = make_chunks(strings, chunksize)
+    if workers == 1:
+        # no need for a pool, but results go through the same path, with the grammar bound to this call as other calls may be running in the same process
+        results = map(partial(parse_chunk_with, (grammar, rule_name, trees, engine, timed)), chunks)
+        pool = None
+    else:
+        pool = Pool(workers, initializer=init_worker, initargs=(grammar, rule_name, trees, engine, timed))
+        # two chunks per worker keep every worker busy while the strings are only read as fast as results are taken
+        results = submit_chunks(pool, chunks, 2 * (workers or os.cpu_count() or 1), ordered)
+
+    try:
+        for chunk in results:
+            for index, result in chunk:
+                if trees and pool is not None:
+                    # trees are pickled without their grammar
+                    for tree in (result[0] if timed else result):
+                        tree.attach(grammar)
+                yield result if ordered else (index, result)
+    finally:
+        if pool is not None:
+            pool.terminate()
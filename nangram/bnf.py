@@ -0,0 +1,202 @@
+"""Hand written reader for BNF grammar sources.
+
+Reads exactly the same language as the BNF meta-grammar in Grammar.parse_bnf, but in a single pass without backtracking.
+"""
+
+from __future__ import annotations
+import string
+from .element import *
+
+WHITESPACE            = frozenset(string.whitespace)
+IDENTIFIER_START      = frozenset(string.ascii_letters + '_')
+IDENTIFIER_CHARACTERS = frozenset(string.ascii_letters + string.digits + '_')
+ITEM_START            = IDENTIFIER_START | frozenset('"<[{(')
+
+class BNFReader:
+    """Recursive descent reader turning a BNF source string into a dictionary of production rules."""
+
+    def __init__(self, source: str):
+        self.source = source.strip()
+        self.position = 0
+
+    def error(self, expected: str):
+        """Raise an error describing what was expected at the current position."""
+
+        line = self.source.count('\n', 0, self.position) + 1
+        column = self.position - (self.source.rfind('\n', 0, self.position) + 1) + 1
+        found = repr(self.source[self.position]) if self.position < len(self.source) else 'end of source'
+        raise ValueError(f'Invalid BNF at line {line}, column {column}: expected {expected}, found {found}.')
+
+    def peek(self) -> str:
+        """Return the next character or an empty string at the end of the source."""
+
+        return self.source[self.position:self.position + 1]
+
+    def expect(self, character: str):
+        """Consume a given character."""
+
+        if self.peek() != character:
+            self.error(repr(character))
+        self.position += 1
+
+    def skip_whitespace(self):
+        """Consume any optional white space."""
+
+        source, position = self.source, self.position
+        while position < len(source) and source[position] in WHITESPACE:
+            position += 1
+        self.position = position
+
+    def read_identifier(self) -> str:
+        """Read an identifier made of letters, digits and underscores not starting with a digit."""
+
+        source, start = self.source, self.position
+        if self.peek() not in IDENTIFIER_START:
+            self.error('identifier')
+        position = start + 1
+        while position < len(source) and source[position] in IDENTIFIER_CHARACTERS:
+            position += 1
+        self.position = position
+        return source[start:position]
+
+    def read_string(self) -> str:
+        """Read a delimited string literal and return its contents."""
+
+        # escaped characters are kept without the escape character, just like StringLiteralCharacter
+        self.expect('"')
+        source, position = self.source, self.position
+        characters = []
+        while True:
+            if position >= len(source):
+                self.position = position
+                self.error("'\"'")
+            character = source[position]
+            if character == '"':
+                break
+            if character == '\\':
+                characters.append(source[position + 1:position + 2])
+                position += 2
+            else:
+                characters.append(character)
+                position += 1
+        self.position = position + 1
+        return ''.join(characters)
+
+    def read_char_class(self) -> str:
+        """Read a character class between angle brackets and return it as written, escapes included."""
+
+        self.expect('<')
+        source, start = self.source, self.position
+        position = start
+        while True:
+            if position >= len(source):
+                self.position = position
+                self.error("'>'")
+            character = source[position]
+            if character == '>':
+                break
+            position += 2 if character == '\\' else 1
+        self.position = position + 1
+        return source[start:position]
+
+    def read_bracketed(self, closing: str) -> Element:
+        """Read an expression enclosed in brackets."""
+
+        self.position += 1
+        self.skip_whitespace()
+        expression = self.read_expression()
+        self.skip_whitespace()
+        self.expect(closing)
+        return expression
+
+    def read_item(self) -> Element:
+        """Read an optionally labeled string, character class, identifier, option, repetition or group."""
+
+        label = None
+        if self.peek() in IDENTIFIER_START:
+            name = self.read_identifier()
+            start = self.position
+            self.skip_whitespace()
+            if self.peek() != ':':
+                self.position = start
+                return Substitution(name)
+            self.position += 1
+            self.skip_whitespace()
+            label = name
+        character = self.peek()
+        if character == '"':
+            return Terminal(self.read_string(), label=label)
+        elif character == '<':
+            return CharClass(self.read_char_class(), label=label)
+        elif character == '[':
+            return Option(self.read_bracketed(']'), label=label)
+        elif character == '{':
+            return Repetition(self.read_bracketed('}'), label=label)
+        elif character == '(':
+            # a labeled group is a choice of a single alternative, so the label doesn't replace one the expression has
+            expression = self.read_bracketed(')')
+            return Choice([expression], label=label) if label else expression
+        elif character in IDENTIFIER_START:
+            return Substitution(self.read_identifier(), label=label)
+        self.error('string, character class, identifier, option, repetition or group')
+
+    def read_sequence(self) -> Element:
+        """Read white space separated items."""
+
+        items = [self.read_item()]
+        while self.peek() in WHITESPACE:
+            start = self.position
+            self.skip_whitespace()
+            if self.peek() not in ITEM_START:
+                self.position = start
+                break
+            items.append(self.read_item())
+        return Sequence(items) if len(items) > 1 else items[0]
+
+    def read_expression(self) -> Element:
+        """Read sequences separated by bars."""
+
+        choices = [self.read_sequence()]
+        while True:
+            start = self.position
+            self.skip_whitespace()
+            if self.peek() != '|':
+                self.position = start
+                break
+            self.position += 1
+            self.skip_whitespace()
+            choices.append(self.read_sequence())
+        return Choice(choices) if len(choices) > 1 else choices[0]
+
+    def read_rule(self) -> (str, Element):
+        """Read a production rule and return its name and element."""
+
+        name = self.read_identifier()
+        self.skip_whitespace()
+        override = None
+        if self.peek() == '"':
+            override = self.read_string()
+            self.skip_whitespace()
+        self.expect('=')
+        self.skip_whitespace()
+        element = self.read_expression()
+        self.skip_whitespace()
+        self.expect('.')
+        element.generation_override = override
+        return name, element
+
+    def read_rules(self) -> dict:
+        """Read the whole source as a sequence of production rules."""
+
+        rules = {}
+        while True:
+            name, element = self.read_rule()
+            rules[name] = element
+            self.skip_whitespace()
+            if self.position >= len(self.source):
+                return rules
+
+def read_bnf(source: str) -> dict:
+    """Return the production rules described by a given BNF source string."""
+
+    return BNFReader(source).read_rules()
@@ -0,0 +1,207 @@
+"""Command line tool for batch jobs: checking files of strings against a grammar, generating expressions and compiling grammars.
+
+Installed as the nangram command, or run with python -m nangram.
+"""
+
+from __future__ import annotations
+from array import array
+from collections import deque
+from time import perf_counter
+import argparse
+import json
+import mmap
+import os
+import random
+import stat
+import sys
+from .grammar import Grammar
+from .util import format_time, percentile
+
+def load_grammar(arguments) -> Grammar:
+    """Load the grammar of a command from a BNF file, or from a .json file made by the compile command, checking it has the starting rule."""
+
+    if arguments.grammar.endswith('.json'):
+        with open(arguments.grammar, encoding='utf-8') as f:
+            grammar = Grammar.load_compiled(f.read())
+    else:
+        grammar = Grammar.load_bnf(arguments.grammar, arguments.cache_dir)
+    if arguments.rule not in grammar.rules:
+        raise ValueError(f'Unknown rule {arguments.rule!r}.')
+    return grammar
+
+def strip_line_ending(line: bytes) -> bytes:
+    if line.endswith(b'\n'):
+        line = line[:-1]
+    if line.endswith(b'\r'):
+        line = line[:-1]
+    return line
+
+def read_lines(path: str, encoding: str = 'utf-8'):
+    """Generate the lines of a file without their line endings, - being standard input.
+
+    Regular files are memory mapped and the lines sliced straight out of the mapping; pipes and other files are read through a buffer.
+    """
+
+    if path == '-':
+        for line in sys.stdin.buffer:
+            yield strip_line_ending(line).decode(encoding)
+        return
+
+    with open(path, 'rb') as f:
+        info = os.fstat(f.fileno())
+        if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+            # empty files can't be mapped
+            for line in f:
+                yield strip_line_ending(line).decode(encoding)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start, size = 0, len(mapped)
+            while start < size:
+                stop = mapped.find(b'\n', start)
+                if stop < 0:
+                    stop = size
+                yield strip_line_ending(mapped[start:stop]).decode(encoding)
+                start = stop + 1
+
+def report(arguments, message: str):
+    """Print a statistics line to standard error unless quiet."""
+
+    if not arguments.quiet:
+        print(message, file=sys.stderr, flush=True)
+
+def check(arguments) -> int:
+    """Check every line of some files against a grammar across worker processes, writing a JSON line per line checked."""
+
+    grammar = load_grammar(arguments)
+    if arguments.optimize:
+        grammar = grammar.optimize([arguments.rule])
+
+    # every file with the index of its first line, queued as the files are read and taken off once their results are all back,
+    # which works out where a result came from without holding on to anything per line read ahead
+    files = deque()
+    def lines():
+        index = 0
+        for path in arguments.files:
+            files.append((path, index))
+            for line in read_lines(path, arguments.encoding):
+                index += 1
+                yield line
+
+    out = sys.stdout
+    latencies = array('d')
+    accepted = 0
+    start = perf_counter()
+    for index, (result, seconds) in enumerate(grammar.parse_many(lines(), arguments.rule, arguments.workers, arguments.chunksize,
+                                                                 trees=arguments.trees, engine=arguments.engine, timed=True)):
+        while len(files) > 1 and files[1][1] <= index:
+            files.popleft()
+        path, first = files[0]
+        number = index - first + 1
+        latencies.append(seconds)
+        is_accepted = bool(result)
+        accepted += is_accepted
+        if arguments.rejected_only and is_accepted:
+            continue
+        row = {'file': path, 'line': number, 'accepted': is_accepted, 'seconds': round(seconds, 6)}
+        if arguments.trees:
+            row['trees'] = len(result)
+        out.write(json.dumps(row) + '\n')
+    out.flush()
+    elapsed = perf_counter() - start
+
+    rows = len(latencies)
+    latencies = sorted(latencies)
+    report(arguments, f'checked {rows} rows in {elapsed:.3f}s, {rows / elapsed if elapsed else 0:.1f} rows/s, {accepted} accepted, {rows - accepted} rejected; '
+                      f'latency p50 {format_time(percentile(latencies, 0.5))} p90 {format_time(percentile(latencies, 0.9))} '
+                      f'p99 {format_time(percentile(latencies, 0.99))} max {format_time(latencies[-1] if latencies else 0)}')
+    return 0 if accepted == rows else 1
+
+def generate(arguments) -> int:
+    """Write sampled or random expressions of a grammar to standard output, one per line."""
+
+    grammar = load_grammar(arguments)
+    rng = random.Random(arguments.seed)
+    if arguments.random:
+        expressions = (grammar.random_expression(arguments.rule, arguments.max_depth, rng=rng) for _ in range(arguments.count))
+    else:
+        random.seed(arguments.seed)
+        expressions = grammar.sample(arguments.count, arguments.rule)
+
+    out = sys.stdout
+    rows = 0
+    start = perf_counter()
+    for expression in expressions:
+        out.write((json.dumps(expression) if arguments.jsonl else expression) + '\n')
+        rows += 1
+    out.flush()
+    elapsed = perf_counter() - start
+    report(arguments, f'generated {rows} expressions in {elapsed:.3f}s, {rows / elapsed if elapsed else 0:.1f} expressions/s')
+    return 0
+
+def compile_(arguments) -> int:
+    """Compile grammars into .json files that load without parsing or analyzing anything."""
+
+    if arguments.output and len(arguments.grammars) > 1:
+        raise ValueError('--output only works with a single grammar.')
+    for path in arguments.grammars:
+        start = perf_counter()
+        grammar = Grammar.load_bnf(path)
+        if arguments.optimize:
+            grammar = grammar.optimize()
+        output = arguments.output or os.path.splitext(path)[0] + '.json'
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(grammar.compile())
+        report(arguments, f'compiled {path} to {output}, {len(grammar.rules)} rules in {perf_counter() - start:.3f}s')
+    return 0
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='nangram', description='Check strings against grammars, generate expressions and compile grammars.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    quiet = argparse.ArgumentParser(add_help=False)
+    quiet.add_argument('-q', '--quiet', action='store_true', help="don't print statistics to standard error")
+
+    def add_grammar(command):
+        command.add_argument('grammar', help='a .bnf grammar, or a .json grammar made by the compile command')
+        command.add_argument('--rule', default='main', help='the starting rule (default main)')
+        command.add_argument('--cache-dir', metavar='DIR', help='cache parsed .bnf grammars in this directory')
+
+    command = commands.add_parser('check', parents=[quiet], help='check every line of some files against a grammar, writing a JSON line per line')
+    add_grammar(command)
+    command.add_argument('files', nargs='+', metavar='file', help='files of strings to check, one per line, - for standard input')
+    command.add_argument('--workers', type=int, help='number of worker processes (default every core)')
+    command.add_argument('--chunksize', type=int, default=256, help='lines sent to a worker at a time (default 256)')
+    command.add_argument('--engine', default='descent', choices=['descent', 'earley'], help='parsing engine (default descent)')
+    command.add_argument('--trees', action='store_true', help='build the parse trees and report how many there are, rather than only recognizing')
+    command.add_argument('--optimize', action='store_true', help='optimize the grammar before checking')
+    command.add_argument('--rejected-only', action='store_true', help='only write the lines that were rejected')
+    command.add_argument('--encoding', default='utf-8', help='encoding of the files (default utf-8)')
+    command.set_defaults(run=check)
+
+    command = commands.add_parser('generate', parents=[quiet], help='write sampled expressions of a grammar to standard output, one per line')
+    add_grammar(command)
+    command.add_argument('-n', '--count', type=int, default=10, help='number of expressions (default 10)')
+    command.add_argument('--random', action='store_true', help='make each expression with a random walk, which allows repeats but works for deep grammars')
+    command.add_argument('--max-depth', type=int, help='maximum substitution depth of random walks (default the maximum recursions)')
+    command.add_argument('--seed', type=int, help='random seed')
+    command.add_argument('--jsonl', action='store_true', help='write every expression as a JSON string, for expressions with line breaks')
+    command.set_defaults(run=generate)
+
+    command = commands.add_parser('compile', parents=[quiet], help='compile .bnf grammars into .json grammars next to them')
+    command.add_argument('grammars', nargs='+', metavar='grammar', help='.bnf grammars to compile')
+    command.add_argument('-o', '--output', help='where to write the compiled grammar, for a single grammar')
+    command.add_argument('--optimize', action='store_true', help='optimize the grammars before compiling them')
+    command.set_defaults(run=compile_)
+    return parser
+
+def main(argv: list = None) -> int:
+    parser = make_parser()
+    arguments = parser.parse_args(argv)
+    try:
+        return arguments.run(arguments)
+    except (OSError, ValueError) as error:
+        if isinstance(error, BrokenPipeError):
+            # the reader went away, like head, so stop quietly without flushing into the closed pipe again
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+        print(f'nangram: {error}', file=sys.stderr)
+        return 1
@@ -0,0 +1,121 @@
+"""Compiled grammar format, a compact JSON document that loads without parsing any BNF or analyzing the grammar again."""
+
+from __future__ import annotations
+from dataclasses import fields
+import json
+from . import element as elements_module
+from .element import *
+from .analysis import ANY, Analysis
+
+FORMAT = 'nangram'
+VERSION = 1
+
+def element_types() -> dict:
+    """Return every element class by name."""
+
+    return {name: value for name, value in vars(elements_module).items()
+            if isinstance(value, type) and issubclass(value, Element) and value is not Element}
+
+def compile_grammar(grammar: Grammar) -> dict:
+    """Return the compiled form of a grammar as JSON compatible data.
+
+    Strings are interned in a table and referred to by index, elements are listed children first and referred to by index so shared elements stay shared,
+    and the nullable, FIRST and FOLLOW sets of the analysis come along so they don't need computing again.
+    """
+
+    analysis = grammar.analysis
+    strings, string_indices = [], {}
+    def intern(string: str) -> int:
+        if string is None:
+            return None
+        index = string_indices.get(string)
+        if index is None:
+            index = string_indices[string] = len(strings)
+            strings.append(string)
+        return index
+
+    def intern_set(characters: frozenset) -> list:
+        # the ANY marker becomes null
+        return [intern(character) for character in sorted(characters - {ANY})] + ([None] if ANY in characters else [])
+
+    types, type_indices = [], {}
+    element_indices = {id(element): index for index, element in enumerate(analysis.elements)}
+    table = []
+    for element in analysis.elements:
+        cls = type(element)
+        if cls.__name__ not in type_indices:
+            type_indices[cls.__name__] = len(types)
+            types.append(cls.__name__)
+        row = [type_indices[cls.__name__]]
+        for f in fields(element):
+            value = getattr(element, f.name)
+            if isinstance(value, Element):
+                row.append(element_indices[id(value)])
+            elif isinstance(value, list):
+                row.append([element_indices[id(item)] for item in value])
+            else:
+                row.append(intern(value))
+        table.append(row)
+
+    return {
+        'format':   FORMAT,
+        'version':  VERSION,
+        'limits':   [grammar.max_products, grammar.max_repetitions, grammar.max_recursions],
+        'strings':  strings,
+        'types':    types,
+        'elements': table,
+        'rules':    [[intern(name), element_indices[id(element)]] for name, element in grammar.rules.items()],
+        'analysis': {
+            'nullable': [int(analysis.nullable[id(element)]) for element in analysis.elements],
+            'first':    [intern_set(analysis.first[id(element)]) for element in analysis.elements],
+            'follow':   [intern_set(analysis.follow[name]) for name in grammar.rules],
+        },
+    }
+
+def load_grammar(cls, data: dict) -> Grammar:
+    """Return the grammar of some compiled data, see compile_grammar."""
+
+    if data.get('format') != FORMAT or data.get('version') != VERSION:
+        raise ValueError(f'Not a compiled grammar of version {VERSION}.')
+
+    strings = data['strings']
+    known = element_types()
+    types = []
+    for name in data['types']:
+        if name not in known:
+            raise ValueError(f'Unknown element type {name!r} in compiled grammar.')
+        types.append(known[name])
+
+    elements = []
+    for row in data['elements']:
+        element_type = types[row[0]]
+        values = []
+        for f, value in zip(fields(element_type), row[1:]):
+            if f.type == 'Element':
+                values.append(elements[value])
+            elif f.type == 'list':
+                values.append([elements[index] for index in value])
+            else:
+                values.append(None if value is None else strings[value])
+        elements.append(element_type(*values))
+
+    grammar = cls({strings[name]: elements[index] for name, index in data['rules']}, *data['limits'])
+
+    def characters(indices: list) -> frozenset:
+        return frozenset(ANY if index is None else strings[index] for index in indices)
+
+    analysis = data['analysis']
+    # made for the rules as they are now, see Grammar.refresh
+    grammar._cache['version'] = grammar.rules.version
+    grammar._cache['analysis'] = Analysis(grammar, precomputed=(
+        [bool(nullable) for nullable in analysis['nullable']],
+        [characters(first) for first in analysis['first']],
+        [characters(follow) for follow in analysis['follow']],
+    ))
+    return grammar
+
+def dumps(grammar: Grammar) -> str:
+    return json.dumps(compile_grammar(grammar), ensure_ascii=False, separators=(',', ':'))
+
+def loads(cls, source: str) -> Grammar:
+    return load_grammar(cls, json.loads(source))
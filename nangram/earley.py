@@ -0,0 +1,201 @@
+"""Earley parsing engine, handling any context-free grammar including left recursive ones."""
+
+from __future__ import annotations
+from heapq import heappush, heappop
+from .element import *
+from .forest import SymbolNode, PrefixNode, COMPOSITE_ELEMENTS
+
+class Production:
+    """A plain context-free production compiled from an element.
+
+    The kind says how a completed production turns into a packed alternative of the element's SymbolNode:
+        sequence, the PrefixNode of all the items (None if there are none),
+        child, the SymbolNode of the single sub-element,
+        empty, the empty derivation (None),
+        loop, the PrefixNode of one or more repeated items; a completed loop keeps waiting for another item.
+    """
+
+    __slots__ = ('element', 'rule', 'key', 'symbols', 'kind')
+
+    def __init__(self, element: Element, rule: str, symbols: tuple, kind: str):
+        self.element = element
+        self.rule = rule
+        self.key = (id(element), rule)
+        self.symbols = symbols
+        self.kind = kind
+
+def compile_productions(grammar: Grammar, element: Element, rule: str) -> list:
+    """Return the productions of an element, each symbol being an (element, rule) pair."""
+
+    if isinstance(element, Substitution):
+        return [Production(element, rule, ((grammar.rules[element.name], element.name),), 'child')]
+    elif isinstance(element, Choice):
+        return [Production(element, rule, ((alternative, rule),), 'child') for alternative in element.elements]
+    elif isinstance(element, Option):
+        return [Production(element, rule, (), 'empty'), Production(element, rule, ((element.element, rule),), 'child')]
+    elif isinstance(element, Sequence):
+        return [Production(element, rule, tuple((item, rule) for item in element.elements), 'sequence')]
+    elif isinstance(element, Repetition):
+        return [Production(element, rule, (), 'empty'), Production(element, rule, ((element.element, rule),), 'loop')]
+    raise TypeError(f'{type(element).__name__} is a leaf element and has no productions.')
+
+class EarleyParser:
+    """Earley parser building the same shared packed parse forest as the recursive descent ForestBuilder.
+
+    Runs in cubic time in the worst case and close to linear time on mostly deterministic grammars.
+    There are no Leo items, so right recursion like s = "a" s | "a" takes quadratic time, as every completion goes back up the whole chain of rules waiting on it.
+    Items are (production, dot, origin) triples and the forest node of an item is the PrefixNode of the symbols before its dot.
+    """
+
+    def __init__(self, grammar: Grammar, string: str):
+        self.grammar = grammar
+        self.string = string
+
+        # compiled productions are kept on the grammar since they don't depend on the string
+        self.productions = grammar._cache.setdefault('earley', {})
+
+        # per position: items and their forest nodes, items waiting on each symbol, completed symbols by origin, predicted symbols and scanned leaves
+        self.items     = {}
+        self.waiting   = {}
+        self.completed = {}
+        self.predicted = {}
+        self.leaves    = {}
+        self.agenda    = {}
+        self.positions = []
+
+    def productions_of(self, element: Element, rule: str) -> list:
+        key = (id(element), rule)
+        productions = self.productions.get(key)
+        if productions is None:
+            productions = self.productions[key] = compile_productions(self.grammar, element, rule)
+        return productions
+
+    def add(self, item: tuple, node: PrefixNode, position: int):
+        """Add an item to the set at a position unless it is already there."""
+
+        items = self.items.get(position)
+        if items is None:
+            items = self.items[position] = {}
+            self.waiting[position] = {}
+            self.completed[position] = {}
+            self.predicted[position] = set()
+            self.leaves[position] = {}
+            self.agenda[position] = []
+            heappush(self.positions, position)
+        if item not in items:
+            items[item] = node
+            self.agenda[position].append((item, node))
+
+    def advance(self, item: tuple, node: PrefixNode, child: SymbolNode):
+        """Move an item's dot over a completed child symbol."""
+
+        production, dot, origin = item
+        if production.kind == 'loop':
+            # repeated items must consume something, just like in the ForestBuilder
+            if child.start == child.stop:
+                return
+            advanced = (production, 1, origin)
+        else:
+            advanced = (production, dot + 1, origin)
+
+        position = child.stop
+        self.add(advanced, None, position)
+        target = self.items[position][advanced]
+        if target is None:
+            target = self.items[position][advanced] = PrefixNode(origin, position)
+        target.packed.append((node, child))
+
+    def complete(self, production: Production, node: PrefixNode, origin: int, position: int):
+        """Add the derivation of a completed production to its element's SymbolNode."""
+
+        if production.kind == 'sequence' or production.kind == 'loop':
+            entry = node
+        elif production.kind == 'child':
+            entry = node.packed[0][1]
+        else:
+            entry = None
+
+        completed = self.completed[position]
+        key = (production.key, origin)
+        symbol = completed.get(key)
+        if symbol is not None:
+            symbol.packed.append(entry)
+            return
+
+        symbol = completed[key] = SymbolNode(production.element, production.rule, origin, position)
+        symbol.packed.append(entry)
+        for item, item_node in list(self.waiting[origin].get(production.key, ())):
+            self.advance(item, item_node, symbol)
+
+    def wait(self, item: tuple, node: PrefixNode, element: Element, rule: str, position: int):
+        """Register an item waiting on a symbol at a position, predicting or scanning the symbol."""
+
+        if not isinstance(element, COMPOSITE_ELEMENTS):
+            self.scan(item, node, element, rule, position)
+            return
+
+        key = (id(element), rule)
+        self.waiting[position].setdefault(key, []).append((item, node))
+
+        # the symbol may already have been completed without consuming anything
+        symbol = self.completed[position].get((key, position))
+        if symbol is not None:
+            self.advance(item, node, symbol)
+
+        if key not in self.predicted[position]:
+            self.predicted[position].add(key)
+            for production in self.productions_of(element, rule):
+                self.add((production, 0, position), None, position)
+
+    def scan(self, item: tuple, node: PrefixNode, element: Element, rule: str, position: int):
+        """Advance an item over a leaf element parsed directly at a position."""
+
+        key = (id(element), rule)
+        symbols = self.leaves[position].get(key)
+        if symbols is None:
+            symbols = self.leaves[position][key] = {}
+            for leaf in element._parse(self.grammar, rule, self.string, position):
+                symbol = symbols.get(leaf.stop)
+                if symbol is None:
+                    symbol = symbols[leaf.stop] = SymbolNode(element, rule, position, leaf.stop)
+                symbol.packed.append(leaf)
+        for symbol in symbols.values():
+            self.advance(item, node, symbol)
+
+    def parse(self, element: Element, rule: str) -> dict:
+        """Return the SymbolNodes of an element starting at the beginning of the string keyed by where they stop."""
+
+        if not isinstance(element, COMPOSITE_ELEMENTS):
+            # a leaf as the starting rule needs no chart at all
+            roots = {}
+            for leaf in element._parse(self.grammar, rule, self.string, 0):
+                roots.setdefault(leaf.stop, SymbolNode(element, rule, 0, leaf.stop)).packed.append(leaf)
+            return roots
+
+        for production in self.productions_of(element, rule):
+            self.add((production, 0, 0), None, 0)
+
+        while self.positions:
+            position = heappop(self.positions)
+            agenda = self.agenda[position]
+            while agenda:
+                item, node = agenda.pop()
+                # the forest node may have been created after the item was queued
+                node = self.items[position][item]
+                production, dot, origin = item
+                if production.kind == 'loop':
+                    if dot:
+                        self.complete(production, node, origin, position)
+                    self.wait(item, node, *production.symbols[0], position)
+                elif dot == len(production.symbols):
+                    self.complete(production, node, origin, position)
+                else:
+                    self.wait(item, node, *production.symbols[dot], position)
+
+        key = (id(element), rule)
+        roots = {}
+        for position in sorted(self.completed):
+            symbol = self.completed[position].get((key, 0))
+            if symbol is not None:
+                roots[position] = symbol
+        return roots
@@ -1,44 +1,80 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
-from itertools import product, count, repeat
+from itertools import islice, accumulate
+from functools import reduce
+from bisect import bisect_right
+import operator
 import string
 import random
-from .node import Node
+import re
+from .node import Node, RepetitionNode
+from .memo import Memo
 from .util import *
 
-# TODO: verbosity in parsing methods?
-
 @dataclass
 class Element(ABC):
     """Represents a grammatical element."""
 
+    # whether parse results are worth caching in a memoization table, cheap leaf elements are faster to reparse
+    memoized = True
+
     # TODO: figure out how to not have to duplicate all the default value fields in the element subclasses
 
-    def _generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def _generate(self, grammar: Grammar, depth: int = 0):
         """Generate all possible strings this element can match."""
 
-        if verbose:
-            print(f'Generation depth = {depth}.')
-
         if depth < grammar.max_recursions:
-            if verbose and self.generation_override:
-                print(f'Generation override = {self.generation_override!r}.')
-            return [self.generation_override] if self.generation_override else self.generate(grammar, depth, verbose)
-
-        if verbose:
-            print(f'Generation depth too high; stopping generation here.')
+            return [self.generation_override] if self.generation_override else self.generate(grammar, depth)
 
         return iter(())
 
+    def _parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
+        """Parse this element, answering from the memoization table if one is given."""
+
+        if memo is None:
+            return self.parse(grammar, rule, string, position)
+        return memo.parse(self, grammar, rule, string, position)
+
+    def _count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count all possible strings this element can generate without generating them."""
+
+        if depth >= grammar.max_recursions:
+            return 0
+        if self.generation_override:
+            return 1
+
+        key = (id(self), depth, grammar.max_repetitions, grammar.max_recursions)
+        n = grammar._counts.get(key)
+        if n is None:
+            n = grammar._counts[key] = self.count(grammar, depth)
+        return n
+
+    def _unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return the string at a given index among all possible strings this element can generate."""
+
+        if self.generation_override:
+            return self.generation_override
+        return self.unrank(grammar, depth, index)
+
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Subclass counting method, falls back on enumerating the generated strings."""
+
+        return get_length(self.generate(grammar, depth))
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Subclass unranking method, falls back on enumerating the generated strings."""
+
+        return next(islice(iter(self.generate(grammar, depth)), index, None))
+
     @abstractmethod
-    def generate(self, grammar: Grammar, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Subclass generation method."""
 
         ...
 
     @abstractmethod
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Generate all possible parse trees."""
 
         ...
@@ -47,25 +83,33 @@ class Element(ABC):
 class Terminal(Element):
     """Represents a terminal string element."""
 
+    memoized = False
+
     # literal string to use as the terminal element
     string: str
     generation_override: str = None
     label: str = None
 
-    def generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Generate the terminal."""
 
-        if verbose:
-            print(f'Generating terminal {self.string!r}.')
-
         yield self.string
 
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count the terminal."""
+
+        return 1
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return the terminal."""
+
+        return self.string
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Parse the terminal."""
 
-        region = slice(position, position + len(self.string))
-        if string[region] == self.string:
-            yield Node(grammar, rule, string, region, label=self.label)
+        if string.startswith(self.string, position):
+            yield Node.span(grammar, rule, string, position, position + len(self.string), label=self.label)
 
     def __str__(self):
         label = f'{self.label}:' if self.label else ''
@@ -80,18 +124,31 @@ class Substitution(Element):
     generation_override: str = None
     label: str = None
 
-    def generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Generate the non-terminal."""
 
-        if verbose:
-            print(f'Generating substitution rule {self.name!r}.')
+        rule = grammar.rules[self.name]
+        if grammar.tracer is not None:
+            return grammar.tracer.trace(self.name, lambda: rule._generate(grammar, depth))
+        return rule._generate(grammar, depth)
+
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count the strings of the non-terminal."""
+
+        return grammar.rules[self.name]._count(grammar, depth)
 
-        return grammar.rules[self.name]._generate(grammar, depth, verbose)
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return a string of the non-terminal."""
 
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+        return grammar.rules[self.name]._unrank(grammar, depth, index)
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Parse the non-terminal."""
 
-        return label_node(grammar.rules[self.name].parse(grammar, self.name, string, position, verbose), self.label)
+        rule = grammar.rules[self.name]
+        if grammar.tracer is not None:
+            return label_node(grammar.tracer.trace(self.name, lambda: rule._parse(grammar, self.name, string, position, memo), position), self.label)
+        return label_node(rule._parse(grammar, self.name, string, position, memo), self.label)
 
     def __str__(self):
         label = f'{self.label}:' if self.label else ''
@@ -106,21 +163,32 @@ class Sequence(Element):
     generation_override: str = None
     label: str = None
 
-    def generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Generate all possible sequences."""
 
-        if verbose:
-            print(f'Generating sequence.')
+        return generate_product(grammar, lambda: (element._generate(grammar, depth + 1) for element in self.elements))
+
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count all possible sequences."""
+
+        return reduce(operator.mul, (element._count(grammar, depth + 1) for element in self.elements), 1)
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return a sequence, the index being a mixed radix number with a digit per element."""
 
-        return generate_product(grammar, lambda: (element._generate(grammar, depth + 1, verbose) for element in self.elements), verbose)
+        strings = []
+        for element in reversed(self.elements):
+            index, digit = divmod(index, element._count(grammar, depth + 1))
+            strings.append(element._unrank(grammar, depth + 1, digit))
+        return ''.join(reversed(strings))
 
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Parse the sequence."""
 
-        return label_node(parse_sequence(self.elements, grammar, rule, string, position, verbose), self.label)
+        return label_node(parse_sequence(self.elements, grammar, rule, string, position, memo), self.label)
 
     def __str__(self):
-        return ' '.join(map(str, self.elements))
+        return ' '.join(f'( {element} )' if isinstance(element, Choice) else str(element) for element in self.elements)
 
 @dataclass
 class Choice(Element):
@@ -131,20 +199,36 @@ class Choice(Element):
     generation_override: str = None
     label: str = None
 
-    def generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Generate all possible choices."""
 
-        if verbose:
-            print(f'Generating choice.')
-
         for element in self.elements:
-            for string in element._generate(grammar, depth + 1, verbose):
+            for string in element._generate(grammar, depth + 1):
                 yield string
 
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count all possible choices."""
+
+        return sum(element._count(grammar, depth + 1) for element in self.elements)
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return a choice, bisecting the running totals of the choices' counts."""
+
+        key = (id(self), depth, grammar.max_repetitions, grammar.max_recursions, 'totals')
+        totals = grammar._counts.get(key)
+        if totals is None:
+            totals = grammar._counts[key] = list(accumulate(element._count(grammar, depth + 1) for element in self.elements))
+        i = bisect_right(totals, index)
+        return self.elements[i]._unrank(grammar, depth + 1, index - (totals[i - 1] if i else 0))
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Parse the choice."""
 
-        return label_node(parse_choice(self.elements, grammar, rule, string, position, verbose), self.label)
+        trie = grammar.analysis.tries.get(id(self))
+        if trie is not None:
+            return label_node(trie.parse(grammar, rule, string, position), self.label)
+        alternatives = grammar.analysis.alternatives(self, string, position)
+        return label_node(parse_choice(alternatives, grammar, rule, string, position, memo), self.label)
 
     def __str__(self):
         return ' | '.join(map(str, self.elements))
@@ -158,21 +242,30 @@ class Option(Element):
     generation_override: str = None
     label: str = None
 
-    def generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Generate the optional element."""
 
-        if verbose:
-            print(f'Generating option.')
-
         yield ""
-        for string in self.element._generate(grammar, depth + 1, verbose):
+        for string in self.element._generate(grammar, depth + 1):
             yield string
 
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count the empty string and the optional element's strings."""
+
+        return 1 + self.element._count(grammar, depth + 1)
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return the empty string or a string of the optional element."""
+
+        return self.element._unrank(grammar, depth + 1, index - 1) if index else ""
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Parse the optional element."""
 
         yield Node(grammar, rule, string, slice(position, position), label=self.label)
-        for node in label_node(self.element.parse(grammar, rule, string, position, verbose), self.label):
+        if not grammar.analysis.can_start(self.element, string, position):
+            return
+        for node in label_node(self.element._parse(grammar, rule, string, position, memo), self.label):
             yield node
                 
     def __str__(self):
@@ -187,37 +280,187 @@ class Repetition(Element):
     generation_override: str = None
     label: str = None
 
-    def generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Generate the repeated element."""
 
-        if verbose:
-            print(f'Generating repetition.')
-
         yield ""
         for n in range(1, grammar.max_repetitions):
-            for prod in generate_product(grammar, lambda: (self.element._generate(grammar, depth + 1, verbose) for _ in range(n)), verbose):
+            for prod in generate_product(grammar, lambda: (self.element._generate(grammar, depth + 1) for _ in range(n))):
                 yield prod
 
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count the repetitions of every length."""
+
+        n = self.element._count(grammar, depth + 1)
+        return sum(n ** repetitions for repetitions in range(grammar.max_repetitions))
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return a repetition, skipping over the blocks of shorter repetitions first."""
+
+        n = self.element._count(grammar, depth + 1)
+        repetitions = 0
+        while index >= n ** repetitions:
+            index -= n ** repetitions
+            repetitions += 1
+        strings = []
+        for _ in range(repetitions):
+            index, digit = divmod(index, n)
+            strings.append(self.element._unrank(grammar, depth + 1, digit))
+        return ''.join(reversed(strings))
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Parse the repeated element."""
 
         yield Node(grammar, rule, string, slice(position, position), label=self.label)
-        for n in count(1):
-            elements = list(repeat(self.element, n))
-            nodes = parse_sequence(elements, grammar, rule, string, position, verbose)
-            m = 0
-            for node in nodes:
-                m += 1
-                if self.label:
-                    yield Node(grammar, rule, string, node.region, [node], label=self.label)
-                else:
-                    yield node
-            if m == 0:
-                break
+        if self.element.__class__ is CharClass:
+            yield from self.parse_run(grammar, rule, string, position, memo)
+            return
+        if not grammar.analysis.can_start(self.element, string, position):
+            return
+
+        # every match of n items is a match of n - 1 items extended by one more, so each round only parses the next item after the previous round's matches,
+        # which come in the same order as parsing the sequence of n items from scratch would give them
+        # matches are kept as where they start and stop and the link of their items, which the nodes of longer matches share, see RepetitionNode
+        # a match starts where its first item does, which is after the position when the item skips something, like the backslash of an escaped character
+        element = self.element
+        matches = [(None, position, None)]
+        while matches:
+            extended = []
+            for start, stop, items in matches:
+                for item in element._parse(grammar, rule, string, stop, memo):
+                    node = RepetitionNode.extend(grammar, rule, string, item.start if start is None else start, item, items)
+                    extended.append((node.start, item.stop, node.items))
+                    yield Node(grammar, rule, string, node.region, [node], label=self.label) if self.label else node
+            matches = extended
+
+    def parse_run(self, grammar: Grammar, rule: str, string: str, position: int, memo: Memo = None):
+        """Parse the non-empty repetitions of a character class, scanning the longest run of matching characters once rather than parsing every repetition again.
+
+        The trees are the same as parsing the repetitions one at a time would make.
+        """
+
+        element = self.element
+        stop = element.run(string, position)
+        if memo is not None:
+            # parse the character ending the run through the table, so tables keeping track of how far parses read, like IncrementalMemo, know about it
+            for _ in element._parse(grammar, rule, string, stop, memo):
+                pass
+        # every match shares the items of the one a character shorter, see RepetitionNode
+        items = None
+        for i in range(position, stop):
+            node = RepetitionNode.extend(grammar, rule, string, position, Node.span(grammar, rule, string, i, i + 1, label=element.label), items)
+            items = node.items
+            yield Node(grammar, rule, string, node.region, [node], label=self.label) if self.label else node
 
     def __str__(self):
         return f'{{ {self.element} }}'
 
+# escapes for common classes of characters in character classes, any other escaped character stands for itself
+CLASS_ESCAPES = {
+    's': string.whitespace,
+    'd': string.digits,
+    'w': string.ascii_letters + string.digits + '_',
+    'n': '\n',
+    't': '\t',
+    'r': '\r',
+}
+
+def class_characters(characters: str) -> (str, bool):
+    """Return the characters of a character class as written between angle brackets, in order and without repeats, and whether the class is negated."""
+
+    negated = characters.startswith('^')
+    position = 1 if negated else 0
+
+    # the characters of the class and whether each one was escaped, escaped ones never start or end a range
+    items = []
+    while position < len(characters):
+        character = characters[position]
+        if character == '\\':
+            escaped = characters[position + 1:position + 2]
+            if not escaped:
+                raise ValueError(f'Character class <{characters}> ends with an escape character.')
+            items.extend((c, True) for c in CLASS_ESCAPES.get(escaped, escaped))
+            position += 2
+        else:
+            items.append((character, False))
+            position += 1
+
+    members = []
+    i = 0
+    while i < len(items):
+        character, escaped = items[i]
+        if not escaped and i + 2 < len(items) and items[i + 1] == ('-', False):
+            last = items[i + 2][0]
+            if last < character:
+                raise ValueError(f'Invalid range {character}-{last} in character class <{characters}>.')
+            members.extend(map(chr, range(ord(character), ord(last) + 1)))
+            i += 3
+        else:
+            members.append(character)
+            i += 1
+
+    if not members and not negated:
+        raise ValueError('Empty character class <>.')
+    return ''.join(dict.fromkeys(members)), negated
+
+@dataclass
+class CharClass(Element):
+    """Represents any single character of a class of characters, like <a-zA-Z_>.
+
+    Classes are written like in regular expressions: ranges like a-z, a leading ^ to match any character that is not in the class,
+    \\s, \\d and \\w for white space, digits and word characters, \\n, \\t and \\r, and a backslash before any other character for the character itself.
+    """
+
+    memoized = False
+
+    # the class as written between the angle brackets
+    characters: str
+    generation_override: str = None
+    label: str = None
+
+    def __post_init__(self):
+        members, self.negated = class_characters(self.characters)
+        self.members = frozenset(members)
+        # a negated class generates the printable characters that aren't in it
+        self.alphabet = ''.join(c for c in string.printable if c not in self.members) if self.negated else members
+        self.pattern = re.compile(f'[{"^" if self.negated else ""}{"".join(map(re.escape, members))}]*' if members else '(?s:.)*')
+
+    def matches(self, character: str) -> bool:
+        """Return whether a character is in the class."""
+
+        return character != '' and (character in self.members) is not self.negated
+
+    def run(self, string: str, position: int) -> int:
+        """Return where the longest run of characters of the class starting at a position stops."""
+
+        return self.pattern.match(string, position).end()
+
+    def generate(self, grammar: Grammar, depth: int = 0):
+        """Generate every character of the class."""
+
+        return iter(self.alphabet)
+
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count the characters of the class."""
+
+        return len(self.alphabet)
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return a character of the class."""
+
+        return self.alphabet[index]
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
+        """Parse a character of the class."""
+
+        character = string[position:position + 1]
+        if character and (character in self.members) is not self.negated:
+            yield Node.span(grammar, rule, string, position, position + 1, label=self.label)
+
+    def __str__(self):
+        label = f'{self.label}:' if self.label else ''
+        return f'{label}<{self.characters}>'
+
 @dataclass
 class StringLiteralCharacter(Element):
     """Specialized element that accepts literal string characters.
@@ -225,6 +468,8 @@ class StringLiteralCharacter(Element):
     This includes all unicode characters, excludes the unescaped string delimiter ("), escape character (\), and includes all escaped characters.
     """
 
+    memoized = False
+
     generation_override: str = None
     label: str = None
 
@@ -236,7 +481,7 @@ class StringLiteralCharacter(Element):
 
         return ''.join([self.escape_character + c for c in string])
 
-    def generate(self, grammar: Grammar, depth: int = 0, verbose: bool = False):
+    def generate(self, grammar: Grammar, depth: int = 0):
         """Generate the character."""
 
         characters = list(string.printable)
@@ -245,14 +490,26 @@ class StringLiteralCharacter(Element):
         # TODO: maybe add some common escape sequences?
         return random.choice(characters)
 
-    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, verbose: bool = False):
+    def count(self, grammar: Grammar, depth: int = 0) -> int:
+        """Count the characters."""
+
+        return len(string.printable)
+
+    def unrank(self, grammar: Grammar, depth: int, index: int) -> str:
+        """Return a character, escaped if needed."""
+
+        character = string.printable[index]
+        return self.escape(character) if character in (self.escape_character, self.delimiter) else character
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0, memo: Memo = None):
         """Parse the character."""
 
-        character = string[position]
+        character = string[position:position + 1]
         region = None
         if character == self.escape_character:
-            region = slice(position + 1, position + 2)
-        elif character != self.delimiter:
+            if position + 1 < len(string):
+                region = slice(position + 1, position + 2)
+        elif character and character != self.delimiter:
             region = slice(position, position + 1)
         if region:
             yield Node(grammar, rule, string, region, label=self.label)
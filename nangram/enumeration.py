@@ -0,0 +1,61 @@
+"""Streaming enumeration of every expression of a grammar within its generation limits."""
+
+from __future__ import annotations
+from itertools import chain
+from .element import *
+
+# sub-languages of at most this many expressions are generated once and then shared
+SHARED_LENGTH = 256
+
+class Enumerator:
+    """Generates every expression of an element one at a time, in the same order as their indices for Element._unrank.
+
+    Small sub-languages are kept in a bounded cache shared by every occurrence of the same element at the same depth,
+    and everything else is regenerated when needed, so memory stays bounded however many expressions are consumed.
+    """
+
+    def __init__(self, grammar: Grammar, max_entries: int = 4096):
+        self.grammar = grammar
+        self.shared = LRU(max_entries)
+
+    def enumerate(self, element: Element, depth: int = 0):
+        """Generate every expression of an element at a depth."""
+
+        grammar = self.grammar
+        length = element._count(grammar, depth)
+        if length == 0:
+            return iter(())
+        if element.generation_override:
+            return iter((element.generation_override,))
+        if length <= SHARED_LENGTH:
+            key = (id(element), depth, grammar.max_repetitions, grammar.max_recursions)
+            strings = self.shared.get(key)
+            if strings is None:
+                strings = list(self.enumerate_element(element, depth))
+                self.shared.put(key, strings)
+            return iter(strings)
+        return self.enumerate_element(element, depth)
+
+    def enumerate_element(self, element: Element, depth: int):
+        if isinstance(element, Substitution):
+            return self.enumerate(self.grammar.rules[element.name], depth)
+        elif isinstance(element, Sequence):
+            return self.enumerate_sequence(element.elements, depth + 1)
+        elif isinstance(element, Choice):
+            return chain.from_iterable(self.enumerate(alternative, depth + 1) for alternative in element.elements)
+        elif isinstance(element, Option):
+            return chain(('',), self.enumerate(element.element, depth + 1))
+        elif isinstance(element, Repetition):
+            return chain.from_iterable(self.enumerate_sequence([element.element] * n, depth + 1) for n in range(self.grammar.max_repetitions))
+        return (element._unrank(self.grammar, depth, index) for index in range(element._count(self.grammar, depth)))
+
+    def enumerate_sequence(self, elements: list, depth: int):
+        """Generate the product of the expressions of some elements, the last one changing fastest."""
+
+        if not elements:
+            yield ''
+            return
+        head, tail = elements[0], elements[1:]
+        for string in self.enumerate(head, depth):
+            for rest in self.enumerate_sequence(tail, depth):
+                yield string + rest
@@ -0,0 +1,330 @@
+"""Shared packed parse forests, holding every parse tree of a string with identical sub-derivations stored once."""
+
+from __future__ import annotations
+from bisect import bisect_right
+from heapq import heappush, heappop
+from itertools import accumulate
+from .node import Node
+from .element import *
+
+# elements that are broken down into forest nodes, anything else is parsed directly as a leaf
+COMPOSITE_ELEMENTS = (Substitution, Choice, Option, Sequence, Repetition)
+
+class SymbolNode:
+    """Forest node for every derivation of an element over a region of the string.
+
+    Each packed alternative is one of:
+        a Node, for leaf elements that are parsed directly,
+        None, for the empty derivation of an Option or Repetition (or an empty Sequence),
+        a SymbolNode, for the derivation of a Substitution, Choice or Option through its sub-element,
+        a PrefixNode, for the items of a Sequence or Repetition.
+    """
+
+    __slots__ = ('element', 'rule', 'start', 'stop', 'packed')
+
+    def __init__(self, element: Element, rule: str, start: int, stop: int):
+        self.element = element
+        self.rule = rule
+        self.start = start
+        self.stop = stop
+        self.packed = []
+
+    def __repr__(self):
+        return f'SymbolNode({self.element}, rule={self.rule!r}, region=({self.start}, {self.stop}), alternatives={len(self.packed)})'
+
+class PrefixNode:
+    """Forest node for every derivation of the first items of a Sequence or Repetition over a region of the string.
+
+    Each packed alternative is a (prefix, child) pair of the PrefixNode for the items before the last one (None if there are none) and the SymbolNode of the last item.
+    """
+
+    __slots__ = ('start', 'stop', 'packed')
+
+    def __init__(self, start: int, stop: int):
+        self.start = start
+        self.stop = stop
+        self.packed = []
+
+    def __repr__(self):
+        return f'PrefixNode(region=({self.start}, {self.stop}), alternatives={len(self.packed)})'
+
+def forest_children(node) -> list:
+    """Return the forest nodes a forest node's packed alternatives refer to."""
+
+    if isinstance(node, PrefixNode):
+        return [child for pair in node.packed for child in pair if child is not None]
+    return [entry for entry in node.packed if isinstance(entry, (SymbolNode, PrefixNode))]
+
+class ForestBuilder:
+    """Builds a parse forest top-down by recursive descent, memoizing the forest nodes of every element at every position.
+
+    Repetitions of elements that match the empty string only count their non-empty matches, so that the forest stays finite.
+    Left recursive grammars cannot be built this way, use the Earley engine for those.
+    """
+
+    def __init__(self, grammar: Grammar, string: str):
+        self.grammar = grammar
+        self.string = string
+        self.table = {}
+
+    def build(self, element: Element, rule: str, position: int) -> dict:
+        """Return the symbol nodes of an element starting at a position keyed by where they stop."""
+
+        key = (id(element), rule, position)
+        nodes = self.table.get(key)
+        if nodes is None:
+            nodes = self.table[key] = self.build_element(element, rule, position)
+        return nodes
+
+    def symbol(self, nodes: dict, element: Element, rule: str, start: int, stop: int) -> SymbolNode:
+        node = nodes.get(stop)
+        if node is None:
+            node = nodes[stop] = SymbolNode(element, rule, start, stop)
+        return node
+
+    def build_element(self, element: Element, rule: str, position: int) -> dict:
+        nodes = {}
+
+        if isinstance(element, Substitution):
+            for stop, child in self.build(self.grammar.rules[element.name], element.name, position).items():
+                self.symbol(nodes, element, rule, position, stop).packed.append(child)
+
+        elif isinstance(element, Choice):
+            for alternative in self.grammar.analysis.alternatives(element, self.string, position):
+                for stop, child in self.build(alternative, rule, position).items():
+                    self.symbol(nodes, element, rule, position, stop).packed.append(child)
+
+        elif isinstance(element, Option):
+            self.symbol(nodes, element, rule, position, position).packed.append(None)
+            for stop, child in self.build(element.element, rule, position).items():
+                self.symbol(nodes, element, rule, position, stop).packed.append(child)
+
+        elif isinstance(element, Sequence):
+            frontier = {position: None}
+            for item in element.elements:
+                prefixes = {}
+                for middle, prefix in frontier.items():
+                    for stop, child in self.build(item, rule, middle).items():
+                        if stop not in prefixes:
+                            prefixes[stop] = PrefixNode(position, stop)
+                        prefixes[stop].packed.append((prefix, child))
+                frontier = prefixes
+            for stop, prefix in frontier.items():
+                self.symbol(nodes, element, rule, position, stop).packed.append(prefix)
+
+        elif isinstance(element, Repetition):
+            self.symbol(nodes, element, rule, position, position).packed.append(None)
+            # every item consumes something, so the prefixes are extended in order of where they stop
+            prefixes = {}
+            middles = [position]
+            while middles:
+                middle = heappop(middles)
+                prefix = prefixes.get(middle)
+                for stop, child in self.build(element.element, rule, middle).items():
+                    if stop == middle:
+                        continue
+                    if stop not in prefixes:
+                        prefixes[stop] = PrefixNode(position, stop)
+                        heappush(middles, stop)
+                    prefixes[stop].packed.append((prefix, child))
+            for stop, prefix in prefixes.items():
+                self.symbol(nodes, element, rule, position, stop).packed.append(prefix)
+
+        else:
+            # anything else is a leaf that parses itself
+            for leaf in element._parse(self.grammar, rule, self.string, position):
+                self.symbol(nodes, element, rule, position, leaf.stop).packed.append(leaf)
+
+        return nodes
+
+class Forest:
+    """A shared packed parse forest of all the parse trees of a string.
+
+    Trees are numbered in a fixed order, so they can be counted, picked by index and iterated over lazily without building any of the others.
+    """
+
+    def __init__(self, grammar: Grammar, string: str, roots: list):
+        self.grammar = grammar
+        self.string = string
+        self.roots = roots
+        self.counts = {}
+        self.totals = {}
+
+    def count(self) -> int:
+        """Return the number of parse trees in the forest."""
+
+        return sum(map(self.count_node, self.roots))
+
+    def count_node(self, node) -> int:
+        """Return the number of derivations of a forest node."""
+
+        counts = self.counts
+        if node in counts:
+            return counts[node]
+
+        # depth first without recursion, since prefix chains are as long as the repetitions they hold
+        stack = [node]
+        visiting = set()
+        while stack:
+            top = stack[-1]
+            if top in counts:
+                stack.pop()
+                continue
+            pending = [child for child in forest_children(top) if child not in counts]
+            if pending:
+                if top in visiting:
+                    raise ValueError(f'Cyclic derivation of {top}; the forest has infinitely many trees.')
+                visiting.add(top)
+                stack.extend(pending)
+                continue
+            counts[top] = self.count_packed(top)
+            stack.pop()
+        return counts[node]
+
+    def count_entry(self, entry) -> int:
+        if isinstance(entry, (SymbolNode, PrefixNode)):
+            return self.counts[entry]
+        return 1
+
+    def count_packed(self, node) -> int:
+        if isinstance(node, PrefixNode):
+            return sum((self.count_entry(prefix) if prefix else 1) * self.counts[child] for prefix, child in node.packed)
+        return sum(map(self.count_entry, node.packed))
+
+    def pick(self, node, index: int) -> (object, int):
+        """Return the packed alternative of a forest node holding the derivation with a given index, and the index within it."""
+
+        totals = self.totals.get(node)
+        if totals is None:
+            self.count_node(node)
+            if isinstance(node, PrefixNode):
+                sizes = ((self.count_entry(prefix) if prefix else 1) * self.counts[child] for prefix, child in node.packed)
+            else:
+                sizes = map(self.count_entry, node.packed)
+            totals = self.totals[node] = list(accumulate(sizes))
+        i = bisect_right(totals, index)
+        return node.packed[i], index - (totals[i - 1] if i else 0)
+
+    def tree(self, index: int) -> Node:
+        """Return the parse tree with a given index."""
+
+        if index < 0:
+            index += self.count()
+        for root in self.roots:
+            n = self.count_node(root)
+            if index < n:
+                return self.tree_of(root, index)
+            index -= n
+        raise IndexError('Parse tree index out of range.')
+
+    def tree_of(self, node: SymbolNode, index: int) -> Node:
+        """Return the derivation with a given index of a symbol node as a parse tree."""
+
+        return self.build_tree(node, index, self.derivation)
+
+    def derivation(self, node: SymbolNode, index: int) -> (object, list):
+        """Return the packed alternative of a symbol node holding the derivation with a given index, and the symbol nodes under it with their indices, in order."""
+
+        entry, index = self.pick(node, index)
+        if isinstance(entry, PrefixNode):
+            parts = []
+            prefix = entry
+            while prefix is not None:
+                (prefix, child), index = self.pick(prefix, index)
+                index, child_index = divmod(index, self.counts[child])
+                parts.append((child, child_index))
+            parts.reverse()
+            return entry, parts
+        if isinstance(entry, SymbolNode):
+            return entry, [(entry, index)]
+        return entry, []
+
+    def build_tree(self, node: SymbolNode, index: int, derivation) -> Node:
+        """Build the parse tree of a derivation of a symbol node, derivation(node, index) choosing the packed alternative of every symbol node, see derivation.
+
+        Works with an explicit stack rather than recursion, since trees are as deep as the derivations they hold, like those of left recursive rules.
+        """
+
+        # trees built so far, and steps still to take: (node, index) to build a derivation, or (node, entry, n) to make a tree out of the last n trees built
+        trees = []
+        stack = [(node, index)]
+        while stack:
+            step = stack.pop()
+            if len(step) == 2:
+                node, index = step
+                entry, parts = derivation(node, index)
+                if not parts:
+                    trees.append(self.make_tree(node, entry, entry))
+                    continue
+                stack.append((node, entry, len(parts)))
+                stack.extend(reversed(parts))
+            else:
+                node, entry, n = step
+                subtrees = trees[-n:]
+                del trees[-n:]
+                trees.append(self.make_tree(node, entry, subtrees if isinstance(entry, PrefixNode) else subtrees[0]))
+        return trees[0]
+
+    def make_tree(self, node: SymbolNode, entry, subtree) -> Node:
+        """Build the parse tree of a symbol node exactly as the element's own parse method would, given the chosen alternative and its parsed sub-tree(s)."""
+
+        element = node.element
+        grammar, string, label = self.grammar, self.string, element.label
+
+        # the empty derivations of options and repetitions carry the label themselves rather than in a wrapper
+        if entry is None:
+            if isinstance(element, Sequence):
+                return label_tree(Node(grammar, node.rule, string, slice(node.stop, node.stop), [Node(grammar, node.rule, string, slice(node.stop, node.stop))]), label)
+            return Node(grammar, node.rule, string, slice(node.start, node.start), label=label)
+
+        if isinstance(entry, PrefixNode):
+            children = subtree + [Node(grammar, node.rule, string, slice(node.stop, node.stop))]
+            return label_tree(Node(grammar, node.rule, string, slice(children[0].start, node.stop), children), label)
+
+        if isinstance(entry, SymbolNode):
+            return label_tree(subtree, label)
+
+        return subtree
+
+    def __iter__(self):
+        """Lazily generate every parse tree in order of their indices."""
+
+        for root in self.roots:
+            for index in range(self.count_node(root)):
+                yield self.tree_of(root, index)
+
+    def disambiguate(self, choose=None) -> Node:
+        """Return a single parse tree, letting a callback pick among the packed alternatives of every ambiguous forest node.
+
+        choose is called as choose(node, alternatives) with the SymbolNode or PrefixNode and the list of its packed alternatives, and returns one of them.
+        Without a callback the first alternative is always chosen.
+        """
+
+        choose = choose or (lambda node, alternatives: alternatives[0])
+        if not self.roots:
+            raise ValueError('The forest is empty.')
+
+        def select(node):
+            return choose(node, node.packed) if len(node.packed) > 1 else node.packed[0]
+
+        def derivation(node: SymbolNode, index: int) -> (object, list):
+            entry = select(node)
+            if isinstance(entry, PrefixNode):
+                parts = []
+                prefix = entry
+                while prefix is not None:
+                    prefix, child = select(prefix)
+                    parts.append((child, None))
+                parts.reverse()
+                return entry, parts
+            if isinstance(entry, SymbolNode):
+                return entry, [(entry, None)]
+            return entry, []
+
+        root = choose(None, self.roots) if len(self.roots) > 1 else self.roots[0]
+        return self.build_tree(root, None, derivation)
+
+def label_tree(tree: Node, label: str = None) -> Node:
+    """Optionally wrap a parse tree with a label node, like label_node does for each yielded node."""
+
+    return Node(tree.grammar, tree.rule, tree.string, tree.region, [tree], label=label) if label else tree
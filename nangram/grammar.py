@@ -1,16 +1,89 @@
 """Expression parser and generator using defined grammars."""
 
 from __future__ import annotations
-from dataclasses import dataclass, field
-import string
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from itertools import count
+from operator import attrgetter
+import random
+import hashlib
+import os
 from .node import Node
+from .memo import Memo
 from .element import *
+from .bnf import read_bnf
+from .forest import Forest, ForestBuilder
+from .earley import EarleyParser
+from .recognizer import Recognizer
+from .analysis import Analysis
+from .batch import parse_many
+from .enumeration import Enumerator
+from .trace import Tracer, PrintTracer
+from .incremental import IncrementalParse
+from .stream import parse_stream
+from .aio import iterate
+from .optimize import optimize_rules
+from .randomwalk import RandomWalk
+from .results import ResultCache
+from . import compiled
+
+# versions of rule dictionaries, every write to one gives it a version no other state of any of them has
+versions = count()
+
+class Rules(dict):
+    """Dictionary of the production rules of a grammar, which takes a new version on every write so that data derived from the rules can tell they changed at once."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = next(versions)
+
+    def changed(self):
+        self.version = next(versions)
+
+    def __setitem__(self, name, element):
+        super().__setitem__(name, element)
+        self.changed()
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self.changed()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.changed()
+
+    def setdefault(self, name, element=None):
+        if name not in self:
+            self[name] = element
+        return self[name]
+
+    def pop(self, name, *default):
+        value = super().pop(name, *default)
+        self.changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self.changed()
+        return item
+
+    def clear(self):
+        super().clear()
+        self.changed()
+
+    def __reduce__(self):
+        # unpickled with a version of its own, as the versions count up separately in every process
+        return type(self), (dict(self),)
 
 @dataclass
 class Grammar:
     """A set of production rules describing a context-free grammar."""
 
-    # the set of production rules
+    # the set of production rules, kept in a Rules dictionary of its own
     rules: dict
 
     # maximum product length, repetitions, and recursions for generation
@@ -18,63 +91,311 @@ class Grammar:
     max_repetitions: int = 4
     max_recursions:  int = 8
 
-    def generate(self, rule_name: str = 'main', verbose: bool = False):
-        """Generate all possible expressions matching a rule in the grammar."""
+    # optional tracer recording what every rule costs when parsing and generating, see Tracer
+    tracer: Tracer = field(default=None, repr=False, compare=False)
+
+    # optional cache of complete parse trees and accept or reject verdicts kept across calls, see ResultCache
+    results: ResultCache = field(default=None, repr=False, compare=False)
+
+    # memoized expression counts of elements, see Element._count
+    _counts: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    # other data derived from the rules, like the compiled productions of the Earley engine
+    _cache: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        if name == 'rules' and not isinstance(value, Rules):
+            value = Rules(value)
+        super().__setattr__(name, value)
+
+    def __getstate__(self):
+        # derived data is keyed by element ids, which don't survive pickling, so it gets rebuilt on the other side
+        state = self.__dict__.copy()
+        state['_counts'] = {}
+        state['_cache'] = {}
+        # traces and cached results stay with the process that made them
+        state['tracer'] = None
+        state['results'] = None
+        return state
+
+    @property
+    def analysis(self) -> Analysis:
+        """Return the nullable, FIRST and FOLLOW sets of the grammar, computed once."""
+
+        analysis = self._cache.get('analysis')
+        if analysis is None:
+            analysis = self._cache['analysis'] = Analysis(self)
+        return analysis
+
+    def generate(self, rule_name: str = 'main', verbose: bool = False, stream: bool = False,
+                 unique: bool = False, false_positive_rate: float = 0.001, max_exact: int = 65536, capacity: int = None):
+        """Generate all possible expressions matching a rule in the grammar.
+
+        By default the combinations of sequences and repetitions are randomly sampled down to max_products.
+        With stream, every expression within the generation limits is generated instead, one at a time in a fixed order straight from its index, so memory stays bounded however many are consumed.
+        With unique, expressions that were already generated are left out, see unique_strings;
+        max_exact expressions are remembered exactly, and any more in a Bloom filter sized for capacity expressions, by default the number of expressions up to a limit.
+        """
+
+        self.refresh()
+        if unique:
+            if capacity is None:
+                capacity = min(self.count(rule_name), 1 << 24)
+            return unique_strings(self.generate(rule_name, verbose, stream), capacity, false_positive_rate, max_exact)
 
         if verbose:
             print(f'Generating with starting rule {rule_name!r}:')
+            return self.traced(PrintTracer()).generate(rule_name, stream=stream)
+
+        if stream:
+            return self.stream(rule_name)
+
+        rule = self.rules[rule_name]
+        if self.tracer is not None:
+            return self.tracer.trace(rule_name, lambda: rule._generate(self))
+        return rule._generate(self)
 
-        return self.rules[rule_name]._generate(self, verbose=verbose)
+    def stream(self, rule_name: str = 'main'):
+        """Generate every expression matching a rule in the grammar within the generation limits, one at a time.
 
-    def parse(self, string: str, rule_name: str = 'main', verbose: bool = False):
-        """Generate all possible parse trees matching a string according to a rule in the grammar."""
+        The expressions come in the order of their indices, see sample.
+        """
+
+        self.refresh()
+        return Enumerator(self).enumerate(self.rules[rule_name])
+
+    def count(self, rule_name: str = 'main') -> int:
+        """Return the number of expressions matching a rule in the grammar within the generation limits.
+
+        The expressions are counted without generating them, and every derivation counts, so ambiguous expressions count more than once.
+        """
+
+        self.refresh()
+        return self.rules[rule_name]._count(self)
+
+    def sample(self, n: int, rule_name: str = 'main'):
+        """Generate n distinct, uniformly distributed random expressions matching a rule in the grammar.
+
+        The expressions are built straight from their index among all the counted expressions rather than by enumerating them.
+        """
+
+        self.refresh()
+        element = self.rules[rule_name]
+        length = element._count(self)
+        for index in sample_indices(length, n):
+            yield element._unrank(self, 0, index)
+
+    def random_expression(self, rule_name: str = 'main', max_depth: int = None, weights: dict = None, rng: random.Random = None) -> str:
+        """Return a random expression matching a rule in the grammar, at most max_depth substitutions deep, by default max_recursions.
+
+        Unlike sample, nothing is counted or enumerated: the expression is made by a single walk down the grammar taking time proportional to its length,
+        so it works for deep grammars with far too many expressions to count.
+        Choices only pick alternatives that can still finish within the depth left, uniformly or by weights, a dictionary from rule names to a weight for each alternative of the rule.
+        Options are taken half of the time, and repetitions repeat up to max_repetitions - 1 times.
+        """
+
+        if rule_name not in self.rules:
+            raise ValueError(f'Unknown rule {rule_name!r}.')
+        self.refresh()
+        walk = self._cache.get('random_walk')
+        if walk is None:
+            walk = self._cache['random_walk'] = RandomWalk(self)
+        return walk.expression(rule_name, self.max_recursions if max_depth is None else max_depth, weights, rng)
+
+    def traced(self, tracer: Tracer) -> Grammar:
+        """Return a copy of the grammar recording into a given tracer, see Tracer."""
+
+        grammar = replace(self, tracer=tracer)
+        # the rules are the same, so everything derived from them is too
+        grammar._counts = self._counts
+        grammar._cache = self._cache
+        return grammar
+
+    def refresh(self):
+        """Drop everything derived from the rules if the rules dictionary was written to since it was derived.
+
+        Called at the start of every parse and generation, so adding, replacing or removing rules between calls is safe; it only compares version numbers.
+        """
+
+        if self._cache.get('version') != self.rules.version:
+            self.invalidate()
+            self._cache['version'] = self.rules.version
+
+    def invalidate(self):
+        """Drop everything derived from the rules, like counts, analyses and cached results.
+
+        Writes to the rules dictionary are noticed by every call anyway, see refresh; this is for elements changed in place, like a sub-element of a sequence or the string of a terminal.
+        """
+
+        # cleared in place, so traced copies sharing them see it too
+        self._counts.clear()
+        self._cache.clear()
+        if self.results is not None:
+            self.results.clear()
+
+    def parse(self, string: str, rule_name: str = 'main', verbose: bool = False, memo: Memo = None, engine: str = 'descent'):
+        """Generate all possible parse trees matching a string according to a rule in the grammar.
+
+        Passing a Memo turns on packrat memoization, which caches the parse trees of every element at every position for the duration of the parse.
+        The default engine is a backtracking recursive descent parser; the 'earley' engine also handles left recursive grammars and takes at most cubic time, but builds every tree from a parse forest.
+        The Earley engine takes quadratic time on right recursive rules, see EarleyParser.
+        """
 
         # TODO: figure out a system for reporting likely syntax errors?
 
+        self.refresh()
+
         if verbose:
             print(f'Parsing with starting rule {rule_name!r}:')
+            return self.traced(PrintTracer()).parse(string, rule_name, memo=memo, engine=engine)
 
-        return self.rules[rule_name].parse(self, rule_name, string, verbose=verbose)
+        if engine != 'descent':
+            return iter(self.parse_forest(string, rule_name, complete=False, engine=engine))
 
-    def parse_complete(self, string: str, rule_name: str = 'main', verbose: bool = False):
-        """Parse a string but filter out any incomplete parse trees."""
+        if memo is not None:
+            memo.begin(string)
 
-        return filter(lambda tree: tree.is_complete, self.parse(string, rule_name, verbose))
+        rule = self.rules[rule_name]
+        if self.tracer is not None:
+            return self.tracer.trace(rule_name, lambda: rule._parse(self, rule_name, string, memo=memo), 0)
+        return rule._parse(self, rule_name, string, memo=memo)
+
+    def parse_complete(self, string: str, rule_name: str = 'main', verbose: bool = False, memo: Memo = None, engine: str = 'descent'):
+        """Parse a string but filter out any incomplete parse trees.
+
+        Other engines than the default build a parse forest of the complete trees only, rather than every tree of every start of the string.
+        With a result cache, strings that were parsed before get their trees straight from it unless a memo, verbose or a tracer is used.
+        """
+
+        if verbose:
+            print(f'Parsing with starting rule {rule_name!r}:')
+            return self.traced(PrintTracer()).parse_complete(string, rule_name, memo=memo, engine=engine)
+
+        if engine != 'descent':
+            trees = lambda: iter(self.parse_forest(string, rule_name, engine=engine))
+        else:
+            trees = lambda: filter(attrgetter('is_complete'), self.parse(string, rule_name, memo=memo))
+
+        if self.results is not None and memo is None and self.tracer is None:
+            # results are keyed by the version of the rules, so results from before a change to them are never returned, without checking anything else on a hit
+            return iter(self.results.trees(('parse_complete', rule_name, engine, string, self.rules.version), trees))
+        return trees()
+
+    def parse_incremental(self, string: str, rule_name: str = 'main', max_entries: int = 1 << 20) -> IncrementalParse:
+        """Parse a string that is going to be edited, see IncrementalParse.
+
+        The complete parse trees are in its trees attribute, and each call to its edit method returns those of the edited string, reparsing only the rules whose matches the edit touched.
+        """
+
+        self.refresh()
+        return IncrementalParse(self, string, rule_name, max_entries)
+
+    def parse_stream(self, file, rule_name: str = 'main', chunk_size: int = 1 << 16, encoding: str = 'utf-8'):
+        """Generate the parse trees of the items of a rule from a file one after another, holding only the unparsed input in memory.
+
+        The file can be a text or binary file object or a memory mapped file, bytes are decoded with the given encoding.
+        The rule must be a repetition of items { item }, optionally preceded by a first item, like item { separator item }; the tree of every item is generated as soon as it is parsed.
+        Each item commits to its longest match, and the trees' regions are relative to the part of the input in their string.
+        Raises ValueError at the first input that doesn't match.
+        """
+
+        self.refresh()
+        return parse_stream(self, file, rule_name, chunk_size, encoding)
+
+    def parse_async(self, string: str, rule_name: str = 'main', memo: Memo = None, engine: str = 'descent',
+                    yield_every: int = 1000, max_steps: int = None, timeout: float = None, executor='thread'):
+        """Asynchronously generate all possible parse trees matching a string according to a rule in the grammar, for asyncio programs.
+
+        By default the parse runs in a thread, so the event loop stays free even while a single tree takes long to find, and hands over the trees found every yield_every steps;
+        a step is every time a rule is used or resumed for another result, see Limits. Cancelling the task also stops the thread at its next step.
+        A parse taking more than max_steps steps or running past a timeout in seconds raises a TimeoutError.
+        Pass a thread pool to run the parse in it, or a process pool to run the whole parse in a worker process within the same limits.
+        With executor=None the parse runs in the event loop itself, which only gets control back between trees, once at least yield_every steps went by,
+        so a parse taking long to find a tree blocks it for that long.
+        The Earley engine only counts the starting rule as a step.
+        """
+
+        return iterate(self, 'parse', (string, rule_name, False, memo, engine), None, yield_every, max_steps, timeout, executor)
+
+    def parse_complete_async(self, string: str, rule_name: str = 'main', memo: Memo = None, engine: str = 'descent',
+                             yield_every: int = 1000, max_steps: int = None, timeout: float = None, executor='thread'):
+        """Asynchronously parse a string but filter out any incomplete parse trees, see parse_async."""
+
+        return iterate(self, 'parse_complete', (string, rule_name, False, memo, engine), None, yield_every, max_steps, timeout, executor)
+
+    def generate_async(self, rule_name: str = 'main', stream: bool = False, unique: bool = False,
+                       yield_every: int = 1000, max_steps: int = None, timeout: float = None, executor='thread'):
+        """Asynchronously generate all possible expressions matching a rule in the grammar, see generate and parse_async."""
+
+        return iterate(self, 'generate', (rule_name, False, stream, unique), None, yield_every, max_steps, timeout, executor)
+
+    def accepts(self, string: str, rule_name: str = 'main', engine: str = 'descent') -> bool:
+        """Return whether a whole string matches a rule in the grammar, without building any parse trees.
+
+        The default engine is a recognizer working on sets of positions, which raises a ValueError for left recursive grammars; the 'earley' engine handles those.
+        With a result cache, verdicts on strings that were checked before come straight from it.
+        """
+
+        def recognize():
+            self.refresh()
+            if engine == 'descent':
+                return Recognizer(self, string).reaches(self.rules[rule_name], 0, len(string))
+            return bool(self.parse_forest(string, rule_name, engine=engine).roots)
+
+        if self.results is not None and self.tracer is None:
+            return self.results.lookup(('accepts', rule_name, engine, string, self.rules.version), recognize)
+        return recognize()
+
+    def match_length(self, string: str, rule_name: str = 'main', engine: str = 'descent') -> int:
+        """Return the length of the longest start of a string that matches a rule in the grammar, or None if none does."""
+
+        self.refresh()
+        if engine == 'descent':
+            ends = Recognizer(self, string).ends(self.rules[rule_name], 0)
+        else:
+            ends = [root.stop for root in self.parse_forest(string, rule_name, complete=False, engine=engine).roots]
+        return max(ends) if ends else None
+
+    def parse_forest(self, string: str, rule_name: str = 'main', complete: bool = True, engine: str = 'descent') -> Forest:
+        """Return a shared packed parse forest of all the parse trees matching a string according to a rule in the grammar.
+
+        The forest is built in polynomial time even when there are exponentially many parse trees.
+        Unless complete is False, only the trees spanning the whole string are kept.
+        """
+
+        self.refresh()
+        if engine == 'descent':
+            nodes = ForestBuilder(self, string).build(self.rules[rule_name], rule_name, 0)
+        elif engine == 'earley':
+            nodes = EarleyParser(self, string).parse(self.rules[rule_name], rule_name)
+        else:
+            raise ValueError(f'Unknown parsing engine {engine!r}.')
+        roots = [node for stop, node in nodes.items() if not complete or stop == len(string)]
+        return Forest(self, string, roots)
+
+    def parse_many(self, strings, rule_name: str = 'main', workers: int = None, chunksize: int = 256, ordered: bool = True, trees: bool = True, engine: str = 'descent', timed: bool = False):
+        """Parse many strings across a pool of worker processes.
+
+        The grammar is sent to each worker once and the strings are sent in chunks, read from strings only a couple of chunks per worker ahead of the results taken.
+        Generates the list of complete parse trees of every string, or just whether it was accepted if trees is False.
+        With timed, every result is paired with the seconds its worker took to parse the string, as (result, seconds).
+        Results come in the order of the strings if ordered is True, otherwise as (index, result) pairs as soon as they are done.
+        """
+
+        return parse_many(self, strings, rule_name, workers, chunksize, ordered, trees, engine, timed)
 
     @classmethod
-    def parse_bnf(cls, source: str):
-        """Return a grammar described by a given BNF source string."""
+    def parse_bnf(cls, source: str, fast: bool = True):
+        """Return a grammar described by a given BNF source string.
+
+        By default the source is read with a hand written single pass reader; pass fast=False to parse it with the BNF meta-grammar instead.
+        """
 
-        # TODO: maybe extract this grammar out so that it doesnt have to be rebuild everytime?
         # TODO: support for comments and import statements
         # TODO: support for convenience elements (whitespace, string literals, numbers, etc)
 
-        # create the BNF grammar itself
-        bnf = Grammar({
-            'string_contents':     Repetition(StringLiteralCharacter()),
-            'optional_whitespace': Repetition(Choice([Terminal(char) for char in string.whitespace]), generation_override=' '),
-
-            # identifier names can contain alphanumeric characters and underscores but must not start with a number
-            'identifier': Sequence([Choice([Terminal(char) for char in string.ascii_letters + '_']), Repetition(Choice([Terminal(char) for char in string.ascii_letters + string.digits + '_']))]),
-
-            # the production rules
-            'rule': Sequence([Substitution('identifier', label='name'), Substitution('optional_whitespace'),
-                              Option(Sequence([Terminal('"'), Substitution('string_contents', label='override'), Terminal('"'), Substitution('optional_whitespace')])),
-                              Terminal('='), Substitution('optional_whitespace'),
-                              Substitution('expression', label='expression'), Substitution('optional_whitespace'),
-                              Terminal('.')]),
-
-            # right hand expression
-            'string':     Sequence([Terminal('"'), Substitution('string_contents', label='contents'), Terminal('"')]),
-            'repetition': Sequence([Terminal('{'), Substitution('optional_whitespace'), Substitution('expression', label='expression'), Substitution('optional_whitespace'), Terminal('}')]),
-            'option':     Sequence([Terminal('['), Substitution('optional_whitespace'), Substitution('expression', label='expression'), Substitution('optional_whitespace'), Terminal(']')]),
-            'item':       Sequence([Option(Sequence([Substitution('identifier', label='label'), Substitution('optional_whitespace'), Terminal(':'), Substitution('optional_whitespace')])), Choice([Substitution('string'), Substitution('identifier'), Substitution('option'), Substitution('repetition')], label='contents')]),
-            'sequence':   Sequence([Substitution('item', label='item'), Repetition(Sequence([Choice([Terminal(char) for char in string.whitespace], generation_override=' '), Substitution('optional_whitespace', generation_override=''), Substitution('item', label='item')]))]),
-            'expression': Sequence([Substitution('sequence', label='choice'), Repetition(Sequence([Substitution('optional_whitespace'), Terminal('|'), Substitution('optional_whitespace'), Substitution('sequence', label='choice')]))]),
-
-            # bnf script is sequence of production rules
-            'main': Sequence([Substitution('rule', label='rule'), Repetition(Sequence([Substitution('optional_whitespace', generation_override='\n'), Substitution('rule', label='rule')]))]),
-        })
+        if fast:
+            return cls(read_bnf(source))
 
         def parse_item(item: Node) -> Element:
             # there may or may not be a label
@@ -86,12 +407,17 @@ class Grammar:
             if node.rule == 'string':
                 # TODO: actually parse the string, for escape chars and such
                 return Terminal(next(node.get('contents')).parsed_string, label=label)
+            elif node.rule == 'char_class':
+                return CharClass(next(node.get('contents')).parsed_string, label=label)
             elif node.rule == 'identifier':
                 return Substitution(node.parsed_string, label=label)
             elif node.rule == 'option':
                 return Option(parse_expression(next(node.get('expression'))), label=label)
             elif node.rule == 'repetition':
                 return Repetition(parse_expression(next(node.get('expression'))), label=label)
+            elif node.rule == 'group':
+                expression = parse_expression(next(node.get('expression')))
+                return Choice([expression], label=label) if label else expression
 
         def parse_choice(sequence: Node) -> Sequence:
             children = list(map(parse_item, sequence.get('item')))
@@ -115,7 +441,7 @@ class Grammar:
             return {name:element for name, element in list(map(parse_rule, tree.get('rule')))}
 
         # parse the source with the BNF grammar
-        parsed = bnf.parse_complete(source.strip())
+        parsed = bnf_grammar().parse_complete(source.strip())
         rule_sets = map(parse_rules, parsed)
         grammars = map(cls, rule_sets)
 
@@ -123,11 +449,89 @@ class Grammar:
         return next(grammars)
 
     @classmethod
-    def load_bnf(cls, path: str):
-        """Return a grammar described by an BNF file given the path to the file."""
+    def load_bnf(cls, path: str, cache_dir: str = None):
+        """Return a grammar described by an BNF file given the path to the file.
+
+        If a cache directory is given, parsed grammars are stored there in the compiled format keyed by a hash of the source, so that loading the same source again skips parsing.
+        """
 
         with open(path) as f:
-            return cls.parse_bnf(f.read())
+            source = f.read()
+
+        if cache_dir is None:
+            return cls.parse_bnf(source)
+
+        digest = hashlib.sha256(source.encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, f'{digest}.json')
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                return cls.load_compiled(f.read())
+        except (OSError, ValueError, LookupError, TypeError):
+            pass
+
+        grammar = cls.parse_bnf(source)
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first so concurrent loaders never see a partial cache entry
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(grammar.compile())
+        os.replace(temporary_path, cache_path)
+        return grammar
+
+    def optimize(self, rule_names: list = None) -> Grammar:
+        """Return an equivalent grammar that is faster to parse, keeping only the rules reachable from some starting rules, by default main, or every rule if there is none.
+
+        Rules that are aliases of other rules or choices among them are inlined where that leaves the parse trees the same, and nested sequences and choices are flattened.
+        Adjacent terminals are merged, and neighbouring alternatives starting with the same element and followed by a single other one share it, like x a | x b becoming x ( a | b ).
+        Those rewrites stay within a rule and keep every label, so nodes report the same rule names and labels as before, but there can be fewer of them,
+        trees of ambiguous grammars can come in another order, and generation limits count fewer levels of nesting.
+        """
+
+        return type(self)(optimize_rules(self, rule_names), self.max_products, self.max_repetitions, self.max_recursions, self.tracer)
+
+    def compile(self) -> str:
+        """Return the grammar in the compiled format, a compact JSON document that load_compiled reads back without parsing or analyzing anything."""
+
+        return compiled.dumps(self)
+
+    @classmethod
+    def load_compiled(cls, source: str):
+        """Return the grammar of a compiled JSON document made by compile."""
+
+        return compiled.loads(cls, source)
 
     def __str__(self):
         return '\n'.join(f'{rule_name} = {self.rules[rule_name]} .' for rule_name in self.rules)
+
+@lru_cache(maxsize=None)
+def bnf_grammar() -> Grammar:
+    """Return the grammar of BNF sources, built once on first use."""
+
+    return Grammar({
+        'string_contents':     Repetition(StringLiteralCharacter()),
+        'optional_whitespace': Repetition(CharClass('\\s'), generation_override=' '),
+        'class_contents':      Repetition(Choice([Sequence([Terminal('\\'), CharClass('^')]), CharClass('^>\\\\')])),
+
+        # identifier names can contain alphanumeric characters and underscores but must not start with a number
+        'identifier': Sequence([CharClass('a-zA-Z_'), Repetition(CharClass('\\w'))]),
+
+        # the production rules
+        'rule': Sequence([Substitution('identifier', label='name'), Substitution('optional_whitespace'),
+                          Option(Sequence([Terminal('"'), Substitution('string_contents', label='override'), Terminal('"'), Substitution('optional_whitespace')])),
+                          Terminal('='), Substitution('optional_whitespace'),
+                          Substitution('expression', label='expression'), Substitution('optional_whitespace'),
+                          Terminal('.')]),
+
+        # right hand expression
+        'string':     Sequence([Terminal('"'), Substitution('string_contents', label='contents'), Terminal('"')]),
+        'char_class': Sequence([Terminal('<'), Substitution('class_contents', label='contents'), Terminal('>')]),
+        'repetition': Sequence([Terminal('{'), Substitution('optional_whitespace'), Substitution('expression', label='expression'), Substitution('optional_whitespace'), Terminal('}')]),
+        'option':     Sequence([Terminal('['), Substitution('optional_whitespace'), Substitution('expression', label='expression'), Substitution('optional_whitespace'), Terminal(']')]),
+        'group':      Sequence([Terminal('('), Substitution('optional_whitespace'), Substitution('expression', label='expression'), Substitution('optional_whitespace'), Terminal(')')]),
+        'item':       Sequence([Option(Sequence([Substitution('identifier', label='label'), Substitution('optional_whitespace'), Terminal(':'), Substitution('optional_whitespace')])), Choice([Substitution('string'), Substitution('char_class'), Substitution('identifier'), Substitution('option'), Substitution('repetition'), Substitution('group')], label='contents')]),
+        'sequence':   Sequence([Substitution('item', label='item'), Repetition(Sequence([CharClass('\\s', generation_override=' '), Substitution('optional_whitespace', generation_override=''), Substitution('item', label='item')]))]),
+        'expression': Sequence([Substitution('sequence', label='choice'), Repetition(Sequence([Substitution('optional_whitespace'), Terminal('|'), Substitution('optional_whitespace'), Substitution('sequence', label='choice')]))]),
+
+        # bnf script is sequence of production rules
+        'main': Sequence([Substitution('rule', label='rule'), Repetition(Sequence([Substitution('optional_whitespace', generation_override='\n'), Substitution('rule', label='rule')]))]),
+    })
@@ -0,0 +1,240 @@
+"""Incremental reparsing of a string after small edits, reusing the parse trees the edit didn't touch."""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from bisect import bisect_right
+from .node import ShiftedNode
+from .memo import Memo
+from .element import *
+
+def lookahead(element: Element) -> int:
+    """Return how many characters past its position an element reads by itself, not counting its sub-elements."""
+
+    if isinstance(element, Terminal):
+        return max(len(element.string), 1)
+    elif isinstance(element, StringLiteralCharacter):
+        # an escape character and the escaped character
+        return 2
+    elif isinstance(element, Choice):
+        # choices of terminals are matched all at once by a trie
+        return max([len(alternative.string) for alternative in element.elements if isinstance(alternative, Terminal)] + [1])
+    # anything else at most peeks at the next character to rule out alternatives
+    return 1
+
+# the length of the stretches of the string whose memoized results move together, see Block
+BLOCK_SIZE = 256
+
+class Block:
+    """The keys of the memoized results at positions within a stretch of the string, which are relative to where the stretch starts.
+
+    An edit moves the start of every stretch after it rather than every result, so the results after an edit aren't touched.
+    """
+
+    __slots__ = ('keys', 'reach')
+
+    def __init__(self):
+        self.keys = set()
+
+        # how far past the start of the stretch the results read at most
+        self.reach = 0
+
+@dataclass
+class IncrementalMemo(Memo):
+    """Memoization table that survives edits to the string.
+
+    Every entry also records its reach, the end of the part of the string that was read to compute it, including failed attempts and lookahead.
+    An edit only invalidates the entries whose position and reach overlap the edited region, every other entry is kept.
+    Entries are keyed by their position within a block of the string, so the ones after an edit move along with the text as their block is moved,
+    and their parse trees are moved onto the new string once they are looked up again, see ShiftedNode.
+    """
+
+    # the reach of every cached result set, relative to the start of its block
+    reaches: dict = field(default_factory=dict, repr=False)
+
+    # the reach of the result set being computed
+    reach: int = field(default=0, repr=False)
+
+    # statistics of the last edit
+    reused:      int = 0
+    invalidated: int = 0
+
+    def __post_init__(self):
+        self.lookaheads = {}
+
+        # where the parse trees of every cached result set were made, in the string they hold
+        self.origins = {}
+
+        # the blocks of the string and where each of them starts, in order
+        self.blocks = [Block()]
+        self.starts = [0]
+
+    def begin(self, string: str):
+        if string is not self.string:
+            self.reaches.clear()
+            self.origins.clear()
+            self.starts = list(range(0, len(string) + 1, BLOCK_SIZE))
+            self.blocks = [Block() for _ in self.starts]
+        super().begin(string)
+
+    def parse(self, element: Element, grammar: Grammar, rule: str, string: str, position: int):
+        """Parse an element like Memo.parse, keeping track of how far into the string the result sets read."""
+
+        width = self.lookaheads.get(id(element))
+        if width is None:
+            width = self.lookaheads[id(element)] = lookahead(element)
+
+        if not element.memoized:
+            self.reach = max(self.reach, position + width)
+            return element.parse(grammar, rule, string, position, self)
+
+        index = bisect_right(self.starts, position) - 1
+        block, start = self.blocks[index], self.starts[index]
+        key = (id(element), rule, block, position - start)
+        nodes = self.get(key)
+        if nodes is not None:
+            self.reach = max(self.reach, start + self.reaches[key])
+            if nodes and nodes[0].string is not string:
+                # made before an edit, so moved onto the new string by how far the edits moved them
+                delta = position - self.origins[key]
+                nodes = self.table[key] = tuple(ShiftedNode.shift(node, string, delta) for node in nodes)
+                self.origins[key] = position
+            return iter(nodes)
+
+        # result sets are computed all at once, so the reach of the nested ones just needs to be saved and restored
+        outer = self.reach
+        self.reach = position + width
+        nodes = tuple(element.parse(grammar, rule, string, position, self))
+        reach = self.reach
+        self.reach = max(outer, reach)
+        self.store(key, nodes)
+        if key in self.table:
+            self.reaches[key] = reach - start
+            self.origins[key] = position
+            block.keys.add(key)
+            block.reach = max(block.reach, reach - start)
+        return iter(nodes)
+
+    def evict(self, key: tuple):
+        super().evict(key)
+        self.discard(key)
+
+    def discard(self, key: tuple):
+        """Forget the reach, origin and block of a result set that is no longer in the table."""
+
+        self.reaches.pop(key, None)
+        self.origins.pop(key, None)
+        key[2].keys.discard(key)
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> str:
+        """Apply an edit to the string, replacing deleted characters at an offset with inserted text, and return the new string.
+
+        Cached results that read any of the deleted characters, or the place where text was inserted, are dropped.
+        Results after the edit are moved by the change in length, which only takes looking at the results in the blocks the edit is in,
+        and at those of earlier blocks that read as far as the edit.
+        """
+
+        if not 0 <= offset <= offset + deleted <= len(self.string):
+            raise ValueError(f'Edit of {deleted} characters at {offset} is outside of the string of length {len(self.string)}.')
+
+        end = offset + deleted
+        delta = len(inserted) - deleted
+        table, reaches, starts, blocks = self.table, self.reaches, self.starts, self.blocks
+        self.invalidated = 0
+
+        def drop(key):
+            del table[key]
+            self.discard(key)
+            self.invalidated += 1
+
+        # parses only read forwards from their position, so results either read nothing from the offset on, or start after the deleted characters
+        first, last = bisect_right(starts, offset) - 1, bisect_right(starts, end) - 1
+        for index in range(first):
+            block, start = blocks[index], starts[index]
+            if start + block.reach > offset:
+                for key in [key for key in block.keys if start + reaches[key] > offset]:
+                    drop(key)
+                block.reach = max((reaches[key] for key in block.keys), default=0)
+
+        # the blocks the edit is in become one, keeping the results before and after the edit
+        block, start = blocks[first], starts[first]
+        moved = []
+        for index in range(first, last + 1):
+            for key in list(blocks[index].keys):
+                position = starts[index] + key[3]
+                if position >= end:
+                    moved.append((key, position, starts[index]))
+                elif starts[index] + reaches[key] > offset:
+                    drop(key)
+        # taken out before any is put back, as moved keys can be the old keys of others
+        entries = []
+        for key, position, base in moved:
+            key[2].keys.discard(key)
+            entries.append((key[:2] + (block, position + delta - start), table.pop(key), reaches.pop(key) + base + delta - start, self.origins.pop(key)))
+        for key, nodes, reach, origin in entries:
+            table[key] = nodes
+            reaches[key] = reach
+            self.origins[key] = origin
+            block.keys.add(key)
+        del blocks[first + 1:last + 1]
+        del starts[first + 1:last + 1]
+        starts[first + 1:] = [start + delta for start in starts[first + 1:]]
+        block.reach = max((reaches[key] for key in block.keys), default=0)
+
+        self.string = self.string[:offset] + inserted + self.string[end:]
+
+        # split up the block if the edit made it long, so later edits in it don't look at too many results
+        stop = starts[first + 1] if first + 1 < len(starts) else len(self.string) + 1
+        if stop - start > 2 * BLOCK_SIZE:
+            self.split(first, stop)
+
+        self.reused = len(table)
+        return self.string
+
+    def split(self, index: int, stop: int):
+        """Split a block ending at stop into blocks of the usual size."""
+
+        block, start = self.blocks[index], self.starts[index]
+        starts = list(range(start, stop, BLOCK_SIZE))
+        blocks = [block] + [Block() for _ in starts[1:]]
+        self.blocks[index:index + 1] = blocks
+        self.starts[index:index + 1] = starts
+        for key in list(block.keys):
+            position = start + key[3]
+            part = bisect_right(starts, position) - 1
+            if part:
+                new_key = key[:2] + (blocks[part], position - starts[part])
+                self.table[new_key] = self.table.pop(key)
+                self.reaches[new_key] = self.reaches.pop(key) + start - starts[part]
+                self.origins[new_key] = self.origins.pop(key)
+                block.keys.discard(key)
+                blocks[part].keys.add(new_key)
+        for block in blocks:
+            block.reach = max((self.reaches[key] for key in block.keys), default=0)
+
+class IncrementalParse:
+    """The parse of a string that can be edited, running the rules again only where each edit touched.
+
+    Reused trees are moved onto the edited string without copying them, so the rules run again take most of the time of an edit.
+    Matches spanning the edit, like a top level repetition, are still put together again from the reused matches of their items, taking a table lookup per item.
+    """
+
+    def __init__(self, grammar: Grammar, string: str, rule_name: str = 'main', max_entries: int = 1 << 20):
+        self.grammar = grammar
+        self.rule_name = rule_name
+        self.memo = IncrementalMemo(max_entries)
+        self.memo.begin(string)
+        self.trees = self.parse()
+
+    @property
+    def string(self) -> str:
+        return self.memo.string
+
+    def parse(self) -> list:
+        return list(self.grammar.parse_complete(self.memo.string, self.rule_name, memo=self.memo))
+
+    def edit(self, offset: int, deleted: int, inserted: str = '') -> list:
+        """Replace deleted characters at an offset with inserted text and return the complete parse trees of the new string."""
+
+        self.memo.edit(offset, deleted, inserted)
+        self.trees = self.parse()
+        return self.trees
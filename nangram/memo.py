@@ -0,0 +1,112 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+
+class Replay:
+    """The parse trees of an element at a position, taken from its parse only as far as they are asked for and shared by every lookup of them."""
+
+    __slots__ = ('nodes', 'parse', 'parsing')
+
+    def __init__(self, parse):
+        self.nodes = []
+        self.parse = parse
+        self.parsing = False
+
+    def __iter__(self):
+        nodes = self.nodes
+        i = 0
+        while True:
+            if i < len(nodes):
+                yield nodes[i]
+                i += 1
+                continue
+            if self.parse is None:
+                return
+            if self.parsing:
+                # the element asked for its own trees at the same position before finding any, which never ends
+                raise RecursionError('Left recursion in the grammar, use the earley engine to parse it.')
+            self.parsing = True
+            try:
+                node = next(self.parse, None)
+            finally:
+                self.parsing = False
+            if node is None:
+                self.parse = None
+                return
+            nodes.append(node)
+
+@dataclass
+class Memo:
+    """Packrat memoization table for a single parse.
+
+    Caches every parse tree an element yields at a position so that backtracking never parses the same element at the same position twice.
+    The trees are only parsed as far as they are asked for, so finding the first parse tree takes no longer than without a table.
+    """
+
+    # maximum number of cached result sets, the oldest ones get evicted first once this is reached
+    max_entries: int = 65536
+
+    # statistics for tuning the memory budget
+    hits:      int = 0
+    misses:    int = 0
+    evictions: int = 0
+
+    # the string the cached results belong to
+    string: str = field(default=None, repr=False)
+
+    # the cached results keyed by (element id, rule, position)
+    table: dict = field(default_factory=dict, repr=False)
+
+    def begin(self, string: str):
+        """Prepare the table for parsing a given string, dropping results from any other string."""
+
+        if string is not self.string:
+            self.table.clear()
+            self.string = string
+
+    def parse(self, element: Element, grammar: Grammar, rule: str, string: str, position: int):
+        """Parse an element, answering from the table when its parse trees at the position are cached."""
+
+        if not element.memoized:
+            return element.parse(grammar, rule, string, position, self)
+
+        key = (id(element), rule, position)
+        nodes = self.get(key)
+        if nodes is None:
+            nodes = self.store(key, Replay(element.parse(grammar, rule, string, position, self)))
+        return iter(nodes)
+
+    def get(self, key: tuple):
+        """Return the cached parse trees for a key or None if they are not cached."""
+
+        nodes = self.table.get(key)
+        if nodes is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return nodes
+
+    def store(self, key: tuple, nodes: tuple) -> tuple:
+        """Cache the parse trees for a key and return them."""
+
+        if self.max_entries <= 0:
+            return nodes
+        while len(self.table) >= self.max_entries:
+            self.evict(next(iter(self.table)))
+        self.table[key] = nodes
+        return nodes
+
+    def evict(self, key: tuple):
+        """Drop a cached result set to make room."""
+
+        del self.table[key]
+        self.evictions += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        """Return the fraction of lookups that were answered from the table."""
+
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.table)
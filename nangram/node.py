@@ -1,55 +1,161 @@
 from __future__ import annotations
-from dataclasses import dataclass, field
 
-@dataclass
 class Node:
-    """Parse tree node."""
+    """Parse tree node.
 
-    # the grammar this was parsed with
-    grammar: Grammar
+    Nodes are created by the thousands for every parse, so they use slots rather than a per-instance dictionary and keep their region as two integers.
+    The parsed string and label lookups are cached once asked for, so change the children of a node before reading those rather than after.
+    """
 
-    # the grammatical rule in the grammar that generated this node
-    rule: str
+    # _exact and _labels cache whether the parsed string is just the region of the string and the nearest branches by label, and are only set once used
+    __slots__ = ('grammar', 'rule', 'string', 'start', 'stop', 'children', 'label', '_exact', '_labels')
 
-    # the original string this was parsed from
-    string: str
+    def __init__(self, grammar: Grammar, rule: str, string: str, region: slice, children: list = None, label: str = None):
+        # the grammar this was parsed with
+        self.grammar = grammar
 
-    # the region of the string parsed
-    region: slice
+        # the grammatical rule in the grammar that generated this node
+        self.rule = rule
 
-    # a list of child nodes, if any
-    children: list = field(default_factory=list)
+        # the original string this was parsed from
+        self.string = string
 
-    # label for this node for easy accessing in a list of children
-    label: str = None
+        # the region of the string parsed
+        self.start = region.start
+        self.stop = region.stop
+
+        # a list of child nodes, if any
+        self.children = [] if children is None else children
+
+        # label for this node for easy accessing in a list of children
+        self.label = label
+
+    @classmethod
+    def span(cls, grammar: Grammar, rule: str, string: str, start: int, stop: int, children: list = None, label: str = None) -> Node:
+        """Create a node from the start and stop of its region rather than a slice."""
+
+        node = cls.__new__(cls)
+        node.grammar = grammar
+        node.rule = rule
+        node.string = string
+        node.start = start
+        node.stop = stop
+        node.children = [] if children is None else children
+        node.label = label
+        return node
+
+    @property
+    def region(self) -> slice:
+        """Return the region of the string parsed."""
+
+        return slice(self.start, self.stop)
+
+    @region.setter
+    def region(self, region: slice):
+        self.start = region.start
+        self.stop = region.stop
+        # whether the parsed string is the region depends on the region
+        try:
+            del self._exact
+        except AttributeError:
+            pass
+
+    def _fields(self) -> tuple:
+        return (self.grammar, self.rule, self.string, self.start, self.stop, tuple(self.children), self.label)
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    __hash__ = None
+
+    def __getstate__(self):
+        # the grammar is left out so that pickled trees are cheap to send between processes, see attach
+        return (self.rule, self.string, self.start, self.stop, self.children, self.label)
+
+    def __setstate__(self, state):
+        self.rule, self.string, self.start, self.stop, self.children, self.label = state
+        self.grammar = None
+
+    def attach(self, grammar: Grammar) -> Node:
+        """Set the grammar of this node and all of its descendants, for trees that were unpickled, and return this node."""
+
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.grammar = grammar
+            stack.extend(node.children)
+        return self
+
+    def __repr__(self):
+        return f'Node(grammar={self.grammar!r}, rule={self.rule!r}, string={self.string!r}, region={self.region!r}, children={self.children!r}, label={self.label!r})'
 
     def get(self, label, exclude=[]):
         """Yield all nearest branches with a given label.
 
         Will not traverse nodes with labels in the exclude list.
+        Without an exclude list the branches are looked up in an index of the labels asked for so far, so asking again for the same label is free.
         """
 
+        if exclude:
+            return self.scan(label, exclude)
+        try:
+            index = self._labels
+        except AttributeError:
+            index = self._labels = {}
+        nodes = index.get(label)
+        if nodes is None:
+            nodes = index[label] = tuple(self.scan(label, ()))
+        return iter(nodes)
+
+    def scan(self, label, exclude=()):
+        """Yield all nearest branches with a given label by walking the tree, not traversing nodes with labels in the exclude list."""
+
         for child in self.children:
             if child.label == label:
                 yield child
             elif child.label not in exclude:
-                for match in child.get(label):
+                for match in child.scan(label, exclude):
                     yield match
 
+    @property
+    def text(self) -> str:
+        """Return the region of the string parsed, including any characters the parse skipped, like escape characters."""
+
+        return self.string[self.start:self.stop]
+
+    @property
+    def is_exact(self) -> bool:
+        """Return whether the parsed string is the region of the string, which it is unless a descendant skipped characters, like escape characters."""
+
+        try:
+            return self._exact
+        except AttributeError:
+            # children are in order and don't overlap, so they cover the region exactly if there is no gap between any of them
+            exact = True
+            position = self.start
+            for child in self.children:
+                if child.start != position or not child.is_exact:
+                    exact = False
+                    break
+                position = child.stop
+            self._exact = exact = exact and (not self.children or position == self.stop)
+            return exact
+
     @property
     def parsed_string(self) -> str:
         """Return the piece of string that was parsed by this node as a whole."""
 
-        if self.children:
-            return ''.join([child.parsed_string for child in self.children])
-        else:
-            return self.string[self.region]
+        if self.is_exact:
+            return self.string[self.start:self.stop]
+        return ''.join([child.parsed_string for child in self.children])
 
     @property
     def is_empty(self) -> bool:
         """Return whether this node matches the empty string."""
 
-        return self.parsed_string == ''
+        return self.start == self.stop or self.parsed_string == ''
 
     @property
     def is_space(self) -> bool:
@@ -61,7 +167,7 @@ class Node:
     def is_complete(self) -> bool:
         """Whether this node spans the whole string."""
 
-        return self.region.start == 0 and self.region.stop == len(self.string)
+        return self.start == 0 and self.stop == len(self.string)
 
     @property
     def filtered_children(self) -> list:
@@ -78,3 +184,103 @@ class Node:
             body = f'\n{line}'.join(child_string.split('\n'))
             string += f'\n{arrow}{body}'
         return string
+
+# the children slot of every node, which repetition nodes hold their items in until they are listed
+children_slot = Node.children
+
+class RepetitionNode(Node):
+    """Node of a match of a repetition, holding its items as the last one and the items of the match one shorter, which it shares.
+
+    Every match of n items only adds one item to a match of n - 1 items, so a repetition makes all its matches in time linear in the items,
+    and only the matches that end up in a tree pay for listing their children, the first time they are asked for, turning them into plain nodes.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def extend(cls, grammar: Grammar, rule: str, string: str, start: int, item: Node, shorter: tuple = None) -> RepetitionNode:
+        """Create the node of a match made of the items of a shorter match, as given by its items link, and one more item.
+
+        Like every node with children, the match starts where its first item does.
+        """
+
+        node = cls.__new__(cls)
+        node.grammar = grammar
+        node.rule = rule
+        node.string = string
+        node.start = start
+        node.stop = item.stop
+        node.label = None
+        children_slot.__set__(node, (item, shorter))
+        return node
+
+    @property
+    def items(self) -> tuple:
+        """Return the link of the items of this match, as a pair of the last item and the link of the items before it, None before the first."""
+
+        return children_slot.__get__(self)
+
+    @property
+    def children(self) -> list:
+        items = []
+        link = children_slot.__get__(self)
+        while link is not None:
+            item, link = link
+            items.append(item)
+        items.reverse()
+        # the trailing empty node every sequence of children ends with
+        items.append(Node.span(self.grammar, self.rule, self.string, self.stop, self.stop))
+        self.children = items
+        return items
+
+    @children.setter
+    def children(self, children: list):
+        children_slot.__set__(self, children)
+        self.__class__ = Node
+
+    def __reduce_ex__(self, protocol):
+        # pickled and copied as the plain node it turns into
+        self.children
+        return Node.__reduce_ex__(self, protocol)
+
+class ShiftedNode(Node):
+    """Node of a parse tree made before an edit to its string, moved onto the edited string by an offset.
+
+    Its children are only moved once they are asked for, so reusing a tree after an edit takes constant time however big it is,
+    and only the parts of it that get looked at pay for being copied, turning into plain nodes like repetition nodes do.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def shift(cls, node: Node, string: str, delta: int) -> ShiftedNode:
+        """Create the node of another node moved onto a string by an offset."""
+
+        # a shifted node is moved from the node it was moved from, so that trees reused over many edits don't hold on to every old string
+        source = children_slot.__get__(node) if node.__class__ is ShiftedNode else node
+        copy = cls.__new__(cls)
+        copy.grammar = node.grammar
+        copy.rule = node.rule
+        copy.string = string
+        copy.start = node.start + delta
+        copy.stop = node.stop + delta
+        copy.label = node.label
+        children_slot.__set__(copy, source)
+        return copy
+
+    @property
+    def children(self) -> list:
+        source = children_slot.__get__(self)
+        delta = self.start - source.start
+        self.children = [ShiftedNode.shift(child, self.string, delta) for child in source.children]
+        return children_slot.__get__(self)
+
+    @children.setter
+    def children(self, children: list):
+        children_slot.__set__(self, children)
+        self.__class__ = Node
+
+    def __reduce_ex__(self, protocol):
+        # pickled and copied as the plain node it turns into
+        self.children
+        return Node.__reduce_ex__(self, protocol)
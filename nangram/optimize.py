@@ -0,0 +1,151 @@
+"""Optimizer rewriting the rules of a grammar into an equivalent grammar with fewer elements to go through when parsing."""
+
+from __future__ import annotations
+from collections import Counter, deque
+from dataclasses import replace
+from .element import *
+from .analysis import sub_elements
+
+def transparent(element: Element) -> bool:
+    """Return whether parsing an element makes no nodes under the rule using it, only nodes of the rules it substitutes.
+
+    Inlining a rule with such a body leaves every parse tree exactly the same, with the same rule names and labels.
+    """
+
+    if isinstance(element, Substitution):
+        return True
+    elif isinstance(element, Choice):
+        return all(map(transparent, element.elements))
+    return False
+
+def plain(element: Element, kind: type) -> bool:
+    """Return whether an element is of a given type without a label or generation override, so it can be merged into its parent."""
+
+    return type(element) is kind and not element.label and not element.generation_override
+
+class Optimizer:
+    """Rewrites the rules of a grammar, see Grammar.optimize.
+
+    Rules are only inlined where no parse tree changes, and the other rewrites stay within a rule and keep every label,
+    so every node still reports the rule name and label it would have in the original grammar.
+    """
+
+    def __init__(self, grammar: Grammar):
+        self.rules = grammar.rules
+
+        # how many times every rule is substituted; choices among rules are only inlined where they are used once, aliases everywhere
+        self.uses = Counter()
+        stack = list(self.rules.values())
+        while stack:
+            element = stack.pop()
+            if isinstance(element, Substitution):
+                self.uses[element.name] += 1
+            stack.extend(sub_elements(element))
+
+    def optimize(self, rule_names: list) -> dict:
+        """Return the optimized rules reachable from some starting rules."""
+
+        rules = {}
+        pending = deque(rule_names)
+        while pending:
+            name = pending.popleft()
+            if name in rules or name not in self.rules:
+                continue
+            element = rules[name] = self.rewrite(self.rules[name], (name,))
+            stack = [element]
+            while stack:
+                element = stack.pop()
+                if isinstance(element, Substitution):
+                    pending.append(element.name)
+                stack.extend(sub_elements(element))
+        return rules
+
+    def rewrite(self, element: Element, inlined: tuple) -> Element:
+        """Return an optimized copy of an element, inlined being the rules it is in."""
+
+        if isinstance(element, Substitution):
+            return self.substitution(element, inlined)
+        elif isinstance(element, Sequence):
+            return self.sequence(element, inlined)
+        elif isinstance(element, Choice):
+            return self.choice(element, inlined)
+        elif isinstance(element, (Option, Repetition)):
+            return replace(element, element=self.rewrite(element.element, inlined))
+        return element
+
+    def substitution(self, element: Substitution, inlined: tuple) -> Element:
+        """Inline rules that are aliases of other rules or choices among them, when they aren't recursive."""
+
+        body = self.rules.get(element.name)
+        if (body is None or element.name in inlined or element.generation_override or (element.label and body.label)
+                or not transparent(body) or (self.uses[element.name] > 1 and not isinstance(body, Substitution))):
+            return element
+        body = self.rewrite(body, inlined + (element.name,))
+        # a labeled substitution wraps every tree of the rule in a label node, just like a labeled body does
+        return replace(body, label=element.label) if element.label else body
+
+    def sequence(self, element: Sequence, inlined: tuple) -> Element:
+        """Flatten nested sequences and merge adjacent terminals."""
+
+        elements = []
+        for child in map(lambda child: self.rewrite(child, inlined), element.elements):
+            for item in (child.elements if plain(child, Sequence) else [child]):
+                if plain(item, Terminal) and elements and plain(elements[-1], Terminal):
+                    elements[-1] = Terminal(elements[-1].string + item.string)
+                else:
+                    elements.append(item)
+        return replace(element, elements=elements)
+
+    def choice(self, element: Choice, inlined: tuple) -> Element:
+        """Flatten nested choices and factor the common first element out of neighbouring alternatives."""
+
+        alternatives = []
+        for child in map(lambda child: self.rewrite(child, inlined), element.elements):
+            alternatives.extend(child.elements if plain(child, Choice) else [child])
+        alternatives = self.factor(alternatives)
+
+        if len(alternatives) == 1 and not element.label and not element.generation_override:
+            # a choice makes no nodes of its own, so a single alternative can stand in for it
+            return alternatives[0]
+        return replace(element, elements=alternatives)
+
+    def factor(self, alternatives: list) -> list:
+        """Turn runs of neighbouring sequences starting with the same element, like x a | x b, into a single sequence x ( a | b ).
+
+        Only neighbours are factored so the alternatives stay in order, and only when what follows the shared element is a single element in every one of them,
+        as a sequence following it would make a node of its own.
+        """
+
+        def head(alternative):
+            return alternative.elements[0] if plain(alternative, Sequence) and len(alternative.elements) > 1 else None
+
+        result = []
+        i = 0
+        while i < len(alternatives):
+            first = head(alternatives[i])
+            j = i + 1
+            while first is not None and j < len(alternatives) and head(alternatives[j]) == first:
+                j += 1
+            if j - i < 2:
+                result.append(alternatives[i])
+            else:
+                rests = self.factor([Sequence(alternative.elements[1:]) if len(alternative.elements) > 2 else alternative.elements[1] for alternative in alternatives[i:j]])
+                if len(rests) == 1:
+                    # the rests had a common first element too, like x y a | x y b, so they were factored into a single sequence y ( a | b )
+                    result.append(Sequence([first] + rests[0].elements))
+                elif any(isinstance(rest, Sequence) for rest in rests):
+                    result.extend(alternatives[i:j])
+                else:
+                    result.append(Sequence([first, Choice(rests)]))
+            i = j
+        return result
+
+def optimize_rules(grammar: Grammar, rule_names: list = None) -> dict:
+    """Return the optimized rules of a grammar reachable from some starting rules, see Grammar.optimize."""
+
+    if rule_names is None:
+        rule_names = ['main'] if 'main' in grammar.rules else list(grammar.rules)
+    for name in rule_names:
+        if name not in grammar.rules:
+            raise ValueError(f'Unknown rule {name!r}.')
+    return Optimizer(grammar).optimize(rule_names)
@@ -0,0 +1,119 @@
+"""Random expressions made by a single walk down the grammar, in time proportional to their length."""
+
+from __future__ import annotations
+from collections import deque
+from itertools import repeat, accumulate
+from bisect import bisect_right
+from math import inf
+import random
+from .element import *
+
+class RandomWalk:
+    """Minimum derivation depths of every element of a grammar, and random walks down the grammar that use them to always finish in time.
+
+    The depth of a derivation is how many substitutions deep it goes below the starting rule.
+    """
+
+    def __init__(self, grammar: Grammar):
+        self.grammar = grammar
+        analysis = grammar.analysis
+
+        # the fewest substitutions deep any derivation of each element goes, inf for elements without finite derivations
+        self.depths = depths = {id(element): inf for element in analysis.elements}
+        dependents = analysis.dependents()
+        queue = deque(analysis.elements)
+        queued = set(depths)
+        while queue:
+            element = queue.popleft()
+            queued.discard(id(element))
+            depth = self.element_depth(element)
+            if depth < depths[id(element)]:
+                depths[id(element)] = depth
+                for dependent in dependents[id(element)]:
+                    if id(dependent) not in queued:
+                        queued.add(id(dependent))
+                        queue.append(dependent)
+
+        # the alternatives of every choice with uniform weights, so picking one doesn't go through all of them
+        self.choices = {id(element): self.alternatives(element) for element in analysis.elements if isinstance(element, Choice)}
+
+    def element_depth(self, element: Element) -> float:
+        """Return the minimum depth of an element from the current ones of its sub-elements."""
+
+        depths = self.depths
+        if isinstance(element, Substitution):
+            rule = self.grammar.rules.get(element.name)
+            return inf if rule is None else depths[id(rule)] + 1
+        elif isinstance(element, Sequence):
+            return max((depths[id(child)] for child in element.elements), default=0)
+        elif isinstance(element, Choice):
+            return min((depths[id(child)] for child in element.elements), default=inf)
+        return 0
+
+    def alternatives(self, choice: Choice, weights: list = None) -> tuple:
+        """Return the alternatives of a choice sorted by minimum depth, their depths, and the running totals of their weights in that order.
+
+        The alternatives that fit in some depth are then the ones before a bisect of the depths, and one of them is picked by a bisect of the totals.
+        """
+
+        depths = self.depths
+        pairs = sorted(zip(choice.elements, repeat(1) if weights is None else weights), key=lambda pair: depths[id(pair[0])])
+        return ([alternative for alternative, _ in pairs], [depths[id(alternative)] for alternative, _ in pairs],
+                list(accumulate(max(weight, 0) for _, weight in pairs)))
+
+    def rule_depth(self, name: str) -> float:
+        """Return the fewest substitutions deep any expression of a rule goes."""
+
+        return self.depths[id(self.grammar.rules[name])]
+
+    def expression(self, rule_name: str, max_depth: int, weights: dict = None, rng: random.Random = None) -> str:
+        """Return a random expression of a rule at most max_depth substitutions deep, see Grammar.random_expression."""
+
+        grammar = self.grammar
+        rng = rng or random
+        weights = weights or {}
+        depths = self.depths
+
+        # the alternatives of choices with weights given, keyed by the choice's id, and of the others
+        weighted = {}
+        for name, rule_weights in weights.items():
+            choice = grammar.rules.get(name)
+            if not isinstance(choice, Choice) or len(rule_weights) != len(choice.elements):
+                raise ValueError(f'Weights for rule {name!r} need to be given for each alternative of a choice.')
+            weighted[id(choice)] = self.alternatives(choice, rule_weights)
+        choices = self.choices
+
+        needed = self.rule_depth(rule_name)
+        if needed > max_depth:
+            raise ValueError(f'Rule {rule_name!r} has no expressions at most {max_depth} substitutions deep, the shallowest are {needed} deep.')
+
+        # elements still to be written out with the depth left for each, leftmost last
+        strings = []
+        stack = [(grammar.rules[rule_name], max_depth)]
+        while stack:
+            element, depth = stack.pop()
+            if element.generation_override:
+                strings.append(element.generation_override)
+            elif isinstance(element, Terminal):
+                strings.append(element.string)
+            elif isinstance(element, Substitution):
+                stack.append((grammar.rules[element.name], depth - 1))
+            elif isinstance(element, Sequence):
+                stack.extend((child, depth) for child in reversed(element.elements))
+            elif isinstance(element, Choice):
+                # only alternatives that can still finish within the depth left, which come first
+                alternatives, alternative_depths, totals = weighted.get(id(element)) or choices[id(element)]
+                fitting = bisect_right(alternative_depths, depth)
+                if not fitting or not totals[fitting - 1]:
+                    raise ValueError(f'No alternative of {element} with a positive weight fits in {depth} more substitutions.')
+                stack.append((alternatives[bisect_right(totals, rng.random() * totals[fitting - 1], 0, fitting - 1)], depth))
+            elif isinstance(element, Option):
+                if depths[id(element.element)] <= depth and rng.random() < 0.5:
+                    stack.append((element.element, depth))
+            elif isinstance(element, Repetition):
+                if depths[id(element.element)] <= depth:
+                    stack.extend(repeat((element.element, depth), rng.randrange(grammar.max_repetitions)))
+            else:
+                # any other element picks one of the strings it can generate
+                strings.append(element._unrank(grammar, 0, rng.randrange(element._count(grammar, 0))))
+        return ''.join(strings)
@@ -0,0 +1,117 @@
+"""Recognizer answering whether a string matches a grammar without building any parse trees."""
+
+from __future__ import annotations
+from .element import *
+
+class Recognizer:
+    """Computes the sets of positions every element can stop at from every position, memoized, without creating any nodes.
+
+    Runs in polynomial time on any grammar without left recursion; left recursion raises a ValueError, use the Earley engine for those grammars.
+    """
+
+    def __init__(self, grammar: Grammar, string: str):
+        self.grammar = grammar
+        self.string = string
+        self.analysis = grammar.analysis
+        self.table = {}
+        self.active = set()
+        self.methods = {Substitution: self.substitution, Sequence: self.sequence, Choice: self.choice, Option: self.option, Repetition: self.repetition}
+
+    def ends(self, element: Element, position: int) -> frozenset:
+        """Return the positions a match of an element starting at a position can stop at."""
+
+        kind = type(element)
+        if kind is Terminal:
+            return frozenset((position + len(element.string),)) if self.string.startswith(element.string, position) else frozenset()
+        if kind is CharClass:
+            return frozenset((position + 1,)) if element.matches(self.string[position:position + 1]) else frozenset()
+
+        key = (id(element), position)
+        ends = self.table.get(key)
+        if ends is not None:
+            return ends
+        if key in self.active:
+            raise ValueError(f'Left recursion in {element} at position {position}; use the earley engine for left recursive grammars.')
+        self.active.add(key)
+        try:
+            if self.analysis.can_start(element, self.string, position):
+                ends = self.methods.get(kind, self.leaf)(element, position)
+            else:
+                ends = frozenset()
+            self.table[key] = ends
+        finally:
+            self.active.discard(key)
+        return ends
+
+    def substitution(self, element: Substitution, position: int) -> frozenset:
+        return self.ends(self.grammar.rules[element.name], position)
+
+    def sequence(self, element: Sequence, position: int) -> frozenset:
+        frontier = {position}
+        for item in element.elements:
+            frontier = set().union(*(self.ends(item, middle) for middle in frontier))
+            if not frontier:
+                break
+        return frozenset(frontier)
+
+    def choice(self, element: Choice, position: int) -> frozenset:
+        trie = self.analysis.tries.get(id(element))
+        if trie is not None:
+            return frozenset(stop for _, stop in trie.match(self.string, position))
+        return frozenset().union(*(self.ends(alternative, position) for alternative in self.analysis.alternatives(element, self.string, position)))
+
+    def option(self, element: Option, position: int) -> frozenset:
+        return self.ends(element.element, position) | {position}
+
+    def repetition(self, element: Repetition, position: int) -> frozenset:
+        if type(element.element) is CharClass:
+            return frozenset(range(position, element.element.run(self.string, position) + 1))
+        ends = {position}
+        pending = [position]
+        while pending:
+            for stop in self.ends(element.element, pending.pop()):
+                if stop not in ends:
+                    ends.add(stop)
+                    pending.append(stop)
+        return frozenset(ends)
+
+    def leaf(self, element: Element, position: int) -> frozenset:
+        # anything else can only tell where it stops by parsing itself
+        return frozenset(node.stop for node in element.parse(self.grammar, None, self.string, position))
+
+    def reaches(self, element: Element, position: int, stop: int) -> bool:
+        """Return whether a match of an element starting at a position can stop at a given position, giving up on the rest once one does."""
+
+        kind = type(element)
+        if kind is Substitution:
+            return self.reaches(self.grammar.rules[element.name], position, stop)
+
+        elif kind is Choice and id(element) not in self.analysis.tries:
+            return any(self.reaches(alternative, position, stop) for alternative in self.analysis.alternatives(element, self.string, position))
+
+        elif kind is Option:
+            return position == stop or self.reaches(element.element, position, stop)
+
+        elif kind is Sequence and element.elements:
+            frontier = {position}
+            for item in element.elements[:-1]:
+                frontier = set().union(*(self.ends(item, middle) for middle in frontier))
+            return any(self.reaches(element.elements[-1], middle, stop) for middle in frontier)
+
+        elif kind is Repetition:
+            if position == stop:
+                return True
+            if type(element.element) is CharClass:
+                return position <= stop <= element.element.run(self.string, position)
+            seen = {position}
+            pending = [position]
+            while pending:
+                for end in self.ends(element.element, pending.pop()):
+                    if end == stop:
+                        return True
+                    if end not in seen:
+                        seen.add(end)
+                        pending.append(end)
+            return False
+
+        return stop in self.ends(element, position)
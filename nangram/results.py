@@ -0,0 +1,68 @@
+"""Cache of parse results across calls, for grammars that see the same strings over and over."""
+
+from __future__ import annotations
+import sys
+from .util import LRU
+from .memo import Replay
+
+def tree_size(trees) -> int:
+    """Return roughly how many bytes some parse trees hold on to, every node counted once."""
+
+    size = 0
+    seen = set()
+    stack = list(trees)
+    while stack:
+        node = stack.pop()
+        if id(node) not in seen:
+            seen.add(id(node))
+            size += sys.getsizeof(node) + sys.getsizeof(node.children)
+            stack.extend(node.children)
+    return size
+
+def result_size(key: tuple, value) -> int:
+    """Return roughly how many bytes a cached result holds on to when it is cached, its string and the trees parsed so far."""
+
+    size = sys.getsizeof(key) + sum(map(sys.getsizeof, key))
+    if isinstance(value, Replay):
+        size += sys.getsizeof(value.nodes) + tree_size(value.nodes)
+    return size
+
+class ResultCache(LRU):
+    """Least recently used complete parse trees and accept or reject verdicts of whole strings, kept from one call to the next.
+
+    Results are keyed by what was asked, the rule, the engine and the string, and held up to a number of entries and a rough total size in bytes.
+    Trees are parsed only as far as some call reads them and the rest are parsed by the next call reading further, like Memo does,
+    so a cached string costs no more than parsing it would even if just its first tree is ever read.
+    Cached trees are shared by every call returning them, so they shouldn't be changed.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 1 << 26):
+        super().__init__(max_entries, max_bytes, result_size)
+
+    def lookup(self, key: tuple, compute):
+        """Return the cached result for a key, computing and caching it if there is none."""
+
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+    def trees(self, key: tuple, parse):
+        """Return the cached parse trees for a key, starting a parse of them if there are none, as a Replay of the trees parsed so far.
+
+        Every tree adds its size to the entry once it is parsed, which can evict the entry or others; trees already read stay valid.
+        """
+
+        replay = self.get(key)
+        if replay is None:
+            replay = Replay(self.sized(key, parse()))
+            self.put(key, replay)
+        return replay
+
+    def sized(self, key: tuple, trees):
+        """Generate some parse trees, adding the size of each to the entry of a key."""
+
+        for tree in trees:
+            self.grow(key, tree_size([tree]))
+            yield tree
@@ -0,0 +1,138 @@
+"""Streaming parser for inputs too large to hold in memory, made of a repetition of items."""
+
+from __future__ import annotations
+import codecs
+from .element import *
+from .incremental import IncrementalMemo
+
+def stream_parts(grammar: Grammar, rule_name: str) -> (Element, Element):
+    """Return the first item and the repeated body of a rule that can be parsed as a stream.
+
+    The rule must either be a repetition { body }, or a first item followed by a repetition, like item { separator item }.
+    """
+
+    element = grammar.rules[rule_name]
+    if isinstance(element, Repetition):
+        return None, element.element
+    if isinstance(element, Sequence) and len(element.elements) == 2 and isinstance(element.elements[1], Repetition):
+        return element.elements[0], element.elements[1].element
+    raise ValueError(f'Rule {rule_name!r} can only be parsed as a stream if it is a repetition, optionally preceded by a first item.')
+
+class StreamReader:
+    """Buffer over a text, binary or memory mapped file holding only the input that hasn't been parsed yet.
+
+    Bytes are decoded incrementally, so multi-byte characters may straddle chunks.
+    """
+
+    def __init__(self, file, chunk_size: int = 1 << 16, encoding: str = 'utf-8'):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.decoder = None
+        self.eof = False
+
+        # the unparsed input and where parsing is at in it
+        self.buffer = ''
+        self.position = 0
+
+        # where the buffer starts in the whole input, for error messages
+        self.offset = 0
+        self.line = 1
+        self.column = 0
+
+    def fill(self, reach: int = 0):
+        """Drop the parsed input and read more onto the rest, at least a chunk.
+
+        Reads until the unparsed input at least doubled and covers reach, a position of the buffer that a parse tried to read,
+        so an item spanning many chunks is parsed again a logarithmic number of times rather than once per chunk.
+        """
+
+        unparsed = len(self.buffer) - self.position
+        wanted = max(2 * unparsed, reach - self.position, 1)
+        self.compact()
+        texts = [self.buffer]
+        while not self.eof and unparsed < wanted:
+            data = self.file.read(max(self.chunk_size, wanted - unparsed))
+            if not data:
+                self.eof = True
+            if isinstance(data, str):
+                text = data
+            else:
+                if self.decoder is None:
+                    self.decoder = codecs.getincrementaldecoder(self.encoding)()
+                text = self.decoder.decode(data, final=self.eof)
+            texts.append(text)
+            unparsed += len(text)
+        self.buffer = ''.join(texts)
+
+    def compact(self):
+        """Drop the parsed input from the buffer."""
+
+        position = self.position
+        if not position:
+            return
+        newline = self.buffer.rfind('\n', 0, position)
+        if newline < 0:
+            self.column += position
+        else:
+            self.line += self.buffer.count('\n', 0, position)
+            self.column = position - newline - 1
+        self.offset += position
+        self.buffer = self.buffer[position:]
+        self.position = 0
+
+    def at_end(self) -> bool:
+        """Return whether all of the input has been parsed."""
+
+        if self.position == len(self.buffer):
+            self.fill()
+        return self.eof and self.position == len(self.buffer)
+
+    def match(self, grammar: Grammar, element: Element, rule: str) -> Node:
+        """Parse the longest non-empty match of an element at the current position and move past it, or return None if there is none.
+
+        A match only counts once parsing it didn't read past the end of the buffer, otherwise more input is read, at least doubling what is left, and it is parsed again.
+        """
+
+        while True:
+            memo = IncrementalMemo()
+            memo.begin(self.buffer)
+            longest = None
+            for node in element._parse(grammar, rule, self.buffer, self.position, memo):
+                if node.stop > self.position and (longest is None or node.stop > longest.stop):
+                    longest = node
+            if memo.reach > len(self.buffer) and not self.eof:
+                self.fill(memo.reach)
+                continue
+            if longest is not None:
+                self.position = longest.stop
+            return longest
+
+    def error(self, rule_name: str):
+        """Raise an error for input that doesn't match at the current position."""
+
+        newline = self.buffer.rfind('\n', 0, self.position)
+        line = self.line + self.buffer.count('\n', 0, self.position)
+        column = self.position - newline if newline >= 0 else self.column + self.position + 1
+        raise ValueError(f'Input does not match rule {rule_name!r} at line {line}, column {column} (offset {self.offset + self.position}).')
+
+def parse_stream(grammar: Grammar, file, rule_name: str = 'main', chunk_size: int = 1 << 16, encoding: str = 'utf-8'):
+    """Generate the parse tree of every item of a stream as soon as it is parsed, see Grammar.parse_stream."""
+
+    first, body = stream_parts(grammar, rule_name)
+    # for rules like item { separator item } the repeated items are picked out of the body
+    unwrap = first is not None and isinstance(body, Sequence) and not body.label and body.elements[-1] == first
+
+    reader = StreamReader(file, chunk_size, encoding)
+    reader.fill()
+    if first is not None:
+        node = reader.match(grammar, first, rule_name)
+        if node is None:
+            reader.error(rule_name)
+        yield node
+    while not reader.at_end():
+        node = reader.match(grammar, body, rule_name)
+        if node is None:
+            reader.error(rule_name)
+        # a sequence node has a child per element and a trailing empty node
+        yield node.children[-2] if unwrap else node
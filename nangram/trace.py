@@ -0,0 +1,161 @@
+"""Instrumentation of parsing and generation, recording what every rule costs."""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from collections import Counter
+from time import perf_counter
+from .node import Node
+from .util import make_padding
+
+# marks an exhausted rule iterator
+END = object()
+
+@dataclass
+class RuleStats:
+    """What a single rule cost over everything a tracer has seen."""
+
+    # number of times the rule was parsed or generated
+    calls: int = 0
+
+    # number of calls that produced nothing
+    failures: int = 0
+
+    # number of times the rule was resumed for another result after producing one
+    backtracks: int = 0
+
+    # parse trees or generated strings produced, counting every result of the rule once however many nodes it is made of
+    results: int = 0
+
+    # seconds spent in the rule including the rules it used, and excluding them
+    time: float = 0.0
+    self_time: float = 0.0
+
+class Tracer:
+    """Records per rule call, failure, backtrack and result counts and timings of parsing and generation.
+
+    Set it as the tracer of a grammar to trace every parse and generate call on that grammar:
+
+        grammar.tracer = Tracer()
+        list(grammar.parse_complete(string))
+        print(grammar.tracer.report())
+
+    Rules are traced where they are substituted, so with the recursive descent parser and generate but not with parse forests or sampling.
+    Results answered from a memoization table never reach the rule and aren't counted.
+    """
+
+    def __init__(self):
+        self.stats = {}
+
+        # self time of every rule call stack, keyed by the rule names joined with semicolons
+        self.stacks = Counter()
+
+        # [stack, time spent in nested rules] of the rules running right now, and how many times each is running
+        self.frames = []
+        self.active = Counter()
+
+    def reset(self):
+        """Forget everything recorded so far."""
+
+        self.stats.clear()
+        self.stacks.clear()
+
+    def trace(self, rule: str, call, position: int = None):
+        """Generate the results of a rule, recording what producing each of them cost.
+
+        call is a function returning the rule's iterator, so that any work done up front counts too.
+        The position is only given when parsing.
+        """
+
+        stats = self.stats.get(rule)
+        if stats is None:
+            stats = self.stats[rule] = RuleStats()
+        stats.calls += 1
+        self.enter(rule, position)
+
+        iterator = None
+        results = 0
+        while True:
+            if results:
+                stats.backtracks += 1
+
+            # the rule is on the stack whenever its iterator runs, which is when it and the rules it uses do their work
+            parent = self.frames[-1] if self.frames else None
+            frame = [f'{parent[0]};{rule}' if parent else rule, 0.0]
+            self.frames.append(frame)
+            self.active[rule] += 1
+            start = perf_counter()
+            try:
+                if iterator is None:
+                    iterator = iter(call())
+                result = next(iterator, END)
+            finally:
+                elapsed = perf_counter() - start
+                self.frames.pop()
+                self.active[rule] -= 1
+                # recursive calls are already inside the time of the outermost one
+                if not self.active[rule]:
+                    stats.time += elapsed
+                stats.self_time += elapsed - frame[1]
+                self.stacks[frame[0]] += elapsed - frame[1]
+                if parent:
+                    parent[1] += elapsed
+
+            if result is END:
+                break
+            results += 1
+            stats.results += 1
+            self.produce(rule, result)
+            yield result
+
+        if not results:
+            stats.failures += 1
+        self.leave(rule, position, results)
+
+    def enter(self, rule: str, position: int = None):
+        """Hook called when a rule is first used."""
+
+        pass
+
+    def produce(self, rule: str, result):
+        """Hook called with every parse tree or string a rule produces."""
+
+        pass
+
+    def leave(self, rule: str, position: int, results: int):
+        """Hook called when a rule has produced all its results."""
+
+        pass
+
+    def report(self, sort: str = 'self_time') -> str:
+        """Return a table of the statistics of every rule, most expensive first."""
+
+        lines = [f'{"rule":<24} {"calls":>8} {"failures":>8} {"backtracks":>10} {"results":>8} {"time":>10} {"self time":>10}']
+        for rule, stats in sorted(self.stats.items(), key=lambda item: getattr(item[1], sort), reverse=True):
+            lines.append(f'{rule:<24} {stats.calls:>8} {stats.failures:>8} {stats.backtracks:>10} {stats.results:>8} '
+                         f'{stats.time * 1000:>8.2f}ms {stats.self_time * 1000:>8.2f}ms')
+        return '\n'.join(lines)
+
+    def collapsed(self) -> str:
+        """Return the profile in the collapsed stack format read by flame graph tools, with self times in microseconds."""
+
+        return '\n'.join(f'{stack} {round(seconds * 1e6)}' for stack, seconds in sorted(self.stacks.items()))
+
+    def write_flamegraph(self, path: str):
+        """Write the collapsed stack profile to a file, for flamegraph.pl, speedscope or inferno."""
+
+        with open(path, 'w') as f:
+            f.write(self.collapsed() + '\n')
+
+class PrintTracer(Tracer):
+    """Tracer also printing every rule it enters and leaves, indented by depth; what the verbose flags use."""
+
+    def enter(self, rule: str, position: int = None):
+        where = f' at {position}' if position is not None else ''
+        print(f'{make_padding(len(self.frames))}{"Parsing" if position is not None else "Generating"} rule {rule!r}{where}.')
+
+    def produce(self, rule: str, result):
+        text = result.parsed_string if isinstance(result, Node) else result
+        print(f'{make_padding(len(self.frames))}Rule {rule!r} produced {text!r}.')
+
+    def leave(self, rule: str, position: int, results: int):
+        print(f'{make_padding(len(self.frames))}Rule {rule!r} done with {results} result(s).')
@@ -0,0 +1,48 @@
+"""Tries of terminal strings, for matching large choices of terminals in one pass."""
+
+from __future__ import annotations
+from .node import Node
+
+class TerminalTrie:
+    """A trie of the strings of a choice of terminals.
+
+    Matching walks the input once, character by character, and finds every terminal matching at a position without slicing the input.
+    """
+
+    # key of the list of terminal indices ending at a trie node, which can't clash with a character
+    END = ''
+
+    def __init__(self, terminals: list):
+        self.terminals = terminals
+        self.root = {}
+        for index, terminal in enumerate(terminals):
+            node = self.root
+            for character in terminal.string:
+                node = node.setdefault(character, {})
+            node.setdefault(self.END, []).append(index)
+
+    def match(self, string: str, position: int) -> list:
+        """Return the indices of the terminals matching at a position of a string, in order, along with where they stop."""
+
+        matches = []
+        node = self.root
+        stop = position
+        while True:
+            indices = node.get(self.END)
+            if indices:
+                matches.extend((index, stop) for index in indices)
+            if stop >= len(string):
+                break
+            node = node.get(string[stop])
+            if node is None:
+                break
+            stop += 1
+        matches.sort()
+        return matches
+
+    def parse(self, grammar: Grammar, rule: str, string: str, position: int = 0):
+        """Generate a node for every terminal matching at a position, just like parsing each terminal in turn would."""
+
+        terminals = self.terminals
+        for index, stop in self.match(string, position):
+            yield Node.span(grammar, rule, string, position, stop, label=terminals[index].label)
@@ -1,8 +1,12 @@
 from __future__ import annotations
-from itertools import product, chain, islice
+from itertools import chain, islice
 from functools import reduce
+from collections import OrderedDict
 import random
 import operator
+import math
+import hashlib
+import sys
 from .node import Node
 
 def get_length(sequence) -> int:
@@ -16,6 +20,41 @@ def get_length(sequence) -> int:
         n += 1
     return n
 
+def sample_indices(length: int, n: int):
+    """Generate n distinct random indices below a length, or all of them if there are fewer, in random order.
+
+    Lengths past what random.sample can take, like the counts of large languages, are sampled by drawing indices and skipping repeats.
+    """
+
+    n = min(n, length)
+    if length <= sys.maxsize:
+        yield from random.sample(range(length), n)
+        return
+    seen = set()
+    while len(seen) < n:
+        index = random.randrange(length)
+        if index not in seen:
+            seen.add(index)
+            yield index
+
+def percentile(values, fraction: float) -> float:
+    """Return a percentile of some sorted values by linear interpolation, 0 if there are none."""
+
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def format_time(seconds: float) -> str:
+    """Return a duration in the largest unit it's at least one of, down to nanoseconds."""
+
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:.2f}{unit}'
+    return f'{seconds / 1e-9:.0f}ns'
+
 def random_sample(sequence_func, n: int, length: int = None):
     """Specialized function to sample n items from a sequence, which may be a generator.
 
@@ -24,7 +63,7 @@ def random_sample(sequence_func, n: int, length: int = None):
 
     # the predeturmined indices of the items to collect
     length = length or get_length(sequence_func())
-    indices = random.sample(range(length), min(n, length))
+    indices = set(sample_indices(length, n))
 
     for i, item in enumerate(sequence_func()):
         if i in indices:
@@ -41,67 +80,219 @@ def random_choice(sequence_func, length: int = None):
     index = random.choice(range(length))
     return next(islice(iter(sequence_func()), index, None))
 
+class LRU:
+    """A dictionary that holds at most a given number of entries, evicting the least recently used ones.
+
+    With max_size and a sizeof function of a key and value, it also holds at most that total size of entries; a single entry bigger than that is never held.
+    """
+
+    def __init__(self, max_entries: int, max_size: int = None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+
+        # sizes of the entries by key and their total, when sized
+        self.sizes = {}
+        self.size = 0
+
+        # statistics for tuning the limits
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the value of a key, marking it as recently used."""
+
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """Set the value of a key, evicting the least recently used entries if needed."""
+
+        if key in self.entries:
+            self.remove(key)
+        if self.sizeof is not None:
+            size = self.sizeof(key, value)
+            if self.max_size is not None and size > self.max_size:
+                return
+            self.sizes[key] = size
+            self.size += size
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def grow(self, key, size: int):
+        """Add to the size of the entry of a key whose value got bigger, evicting the least recently used entries if needed."""
+
+        if key not in self.sizes:
+            return
+        self.sizes[key] += size
+        self.size += size
+        if self.max_size is not None and self.sizes[key] > self.max_size:
+            self.remove(key)
+        while self.max_size is not None and self.size > self.max_size:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        """Drop the entry of a key."""
+
+        del self.entries[key]
+        self.size -= self.sizes.pop(key, 0)
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.size = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Return the fraction of lookups that found their key."""
+
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+class BloomFilter:
+    """A set of strings in a fixed amount of memory, which may claim to hold strings it doesn't at a configurable false positive rate.
+
+    Sized for a given number of strings; adding more than that raises the false positive rate.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, string: str):
+        """Return the bit positions of a string, by double hashing a single digest."""
+
+        digest = hashlib.blake2b(string.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], 'little')
+        b = int.from_bytes(digest[8:], 'little') | 1
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+    def add(self, string: str) -> bool:
+        """Add a string and return whether it wasn't in the set before."""
+
+        bits = self.bits
+        new = False
+        for position in self.positions(string):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def __contains__(self, string: str):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(string))
+
+    def __len__(self):
+        return self.count
+
+def unique_strings(strings, capacity: int, false_positive_rate: float = 0.001, max_exact: int = 65536):
+    """Yield strings leaving out any repeats.
+
+    The first max_exact distinct strings are remembered exactly, after that they move into a Bloom filter sized for capacity strings,
+    so memory stays bounded; repeats never get through, but unique strings are dropped at the filter's false positive rate.
+    """
+
+    seen = set()
+    bloom = None
+    for string in strings:
+        if bloom is None:
+            if string in seen:
+                continue
+            seen.add(string)
+            if len(seen) > max_exact:
+                bloom = BloomFilter(capacity, false_positive_rate)
+                for old in seen:
+                    bloom.add(old)
+                seen = None
+            yield string
+        elif bloom.add(string):
+            yield string
+
 def make_padding(indent: int) -> str:
     """Make a left-side whitespace padding for a given indention level."""
 
     return '   ' * indent
 
 def label_node(sequence, label: str = None):
-    """Optionally wrap all yielded nodes with a label node if provided."""
+    """Optionally wrap all yielded nodes with a label node if provided.
 
-    for node in sequence:
-        if label:
-            yield Node(node.grammar, node.rule, node.string, node.region, [node], label=label)
-        else:
-            yield node
+    Without a label the sequence is returned as it is, rather than adding a generator to every level of the parse.
+    """
+
+    if not label:
+        return sequence
+    return (Node(node.grammar, node.rule, node.string, node.region, [node], label=label) for node in sequence)
 
-def parse_choice(elements: list, grammar: Grammar, rule: str, string, position: int = 0, verbose: bool = False):
+def parse_choice(elements: list, grammar: Grammar, rule: str, string, position: int = 0, memo: Memo = None):
     """Parse a choice among elements."""
 
-    return chain(*(element.parse(grammar, rule, string, position, verbose) for element in elements))
+    return chain.from_iterable(element._parse(grammar, rule, string, position, memo) for element in elements)
+
+def parse_sequence(elements: list, grammar: Grammar, rule: str, string, position: int = 0, memo: Memo = None):
+    """Parse a sequence of elements.
 
-def parse_sequence(elements: list, grammar: Grammar, rule: str, string, position: int = 0, verbose: bool = False):
-    """Parse a sequence of elements."""
+    Backtracks with an explicit stack of the parses of every element rather than a generator per element, so long sequences don't run into the recursion limit.
+    """
+
+    if not elements:
+        yield Node(grammar, rule, string, slice(position, position), [Node(grammar, rule, string, slice(position, position))])
+        return
 
-    def sequential_choices(elements: list, position: int) -> list:
-        if elements:
-            head, tail = elements[0], elements[1:]
-            head_choices = head.parse(grammar, rule, string, position, verbose)
-            for head_choice in head_choices:
-                tail_choices = sequential_choices(tail, head_choice.region.stop)
-                for tail_choice in tail_choices:
-                    yield [head_choice] + tail_choice
+    # the parses still to try of every element so far, and the node each of them is at
+    parses = [elements[0]._parse(grammar, rule, string, position, memo)]
+    children = []
+    while parses:
+        child = next(parses[-1], None)
+        if child is None:
+            parses.pop()
+            if children:
+                children.pop()
+            continue
+        children.append(child)
+        if len(children) < len(elements):
+            parses.append(elements[len(children)]._parse(grammar, rule, string, child.stop, memo))
         else:
-            yield [Node(grammar, rule, string, slice(position, position))]
+            yield Node.span(grammar, rule, string, children[0].start, child.stop, children + [Node.span(grammar, rule, string, child.stop, child.stop)])
+            children.pop()
+
+def unrank_product(pools: list, index: int) -> list:
+    """Return the item at a given index in the cartesian product of some lists without enumerating the product."""
 
-    for children in sequential_choices(elements, position):
-        region = slice(children[0].region.start, children[-1].region.stop)
-        yield Node(grammar, rule, string, region, children)
+    items = []
+    for pool in reversed(pools):
+        index, digit = divmod(index, len(pool))
+        items.append(pool[digit])
+    items.reverse()
+    return items
 
-def generate_product(grammar: Grammar, generators_func, verbose: bool = False):
-    """Generate the combinations of some generators.
+def generate_product(grammar: Grammar, generators_func):
+    """Generate a random sample of the combinations of some generators.
 
     generators_func is a function to return a list of generators.
     """
 
-    if verbose:
-        length = get_length(generators_func())
-        print("Generating product of {length} sequences.")
-    lengths = list(map(get_length, generators_func()))
-    length = reduce(operator.mul, lengths, 1)
-    for prod in random_sample(lambda: product(*generators_func()), grammar.max_products, length):
-        yield ''.join(prod)
-
-    # TODO: get way more performance out of this lol
-
-    #for i, prod in enumerate(product(*generators_func())):
-    #    if i < grammar.max_products:
-    #        if verbose:
-    #            print(f'Joining sequence of length {len(prod)}.')
-    #        yield ''.join(prod)
-    #        if verbose:
-    #            print(f'Finished joining sequence.')
-    #    else:
-    #        if verbose:
-    #            print(f'Generation sequence too long; stopping generation here.')
-    #        break
+    # every generator is only run once, and the sampled combinations are picked out of the product by index
+    pools = [list(generator) for generator in generators_func()]
+    length = reduce(operator.mul, map(len, pools), 1)
+    for index in sorted(sample_indices(length, grammar.max_products)):
+        yield ''.join(unrank_product(pools, index))